@@ -0,0 +1,218 @@
+"""
+Mantenimiento incremental de `pipeline_aggregates`.
+
+Los handlers de deals llaman a `record_deal_change` con el estado del deal
+antes y después del cambio, antes de hacer commit, así el rollup se
+actualiza en la misma transacción (`record_stage_change` para los cambios
+de etapa masivos). El dashboard lee de esta tabla en lugar de agrupar toda
+la tabla `deals`.
+
+Para corregir cualquier desviación (o poblar la tabla la primera vez):
+
+    python -m app.aggregates
+"""
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import mysql, sqlite
+
+from app import models
+
+Aggregate = models.PipelineAggregate
+
+# probabilidad de cierre por etapa: valor esperado = total_amount * prob
+STAGE_PROBABILITY = {
+    "prospecting": 0.2,
+    "qualified": 0.4,
+    "proposal": 0.7,
+    "won": 1.0,
+    "lost": 0.0,
+}
+
+
+class DealState(NamedTuple):
+    owner_user_id: int
+    stage: str
+    currency: str
+    amount: Decimal
+
+
+def deal_state(deal: models.Deal) -> DealState:
+    """Foto de los campos del deal que afectan al rollup."""
+    return DealState(
+        owner_user_id=deal.owner_user_id or 0,
+        stage=deal.stage or "prospecting",
+        currency=deal.currency or "EUR",
+        amount=Decimal(str(deal.amount or 0)),
+    )
+
+
+def record_deal_change(
+    db,
+    before: Optional[DealState],
+    after: Optional[DealState],
+) -> None:
+    """
+    Aplica al rollup el paso de `before` a `after` (None = el deal no
+    existía / ya no existe).
+    """
+    deltas: Dict[Tuple[int, str, str], list] = defaultdict(lambda: [0, Decimal(0)])
+    if before is not None:
+        key = before[:3]
+        deltas[key][0] -= 1
+        deltas[key][1] -= before.amount
+    if after is not None:
+        key = after[:3]
+        deltas[key][0] += 1
+        deltas[key][1] += after.amount
+
+    apply_deltas(db, deltas)
+
+
+def record_stage_change(db, deal_ids: List[int], stage: str) -> None:
+    """
+    Aplica al rollup el paso a `stage` de varios deals (cambio masivo).
+    Una sola query agrupada con el estado actual de los deals que cambian;
+    hay que llamarla antes del UPDATE, en la misma transacción.
+    """
+    Deal = models.Deal
+    owner = func.coalesce(Deal.owner_user_id, 0)
+    groups = db.execute(
+        select(
+            owner,
+            Deal.stage,
+            Deal.currency,
+            func.count(Deal.id),
+            func.coalesce(func.sum(Deal.amount), 0),
+        )
+        .where(Deal.id.in_(deal_ids), Deal.stage != stage)
+        .group_by(owner, Deal.stage, Deal.currency)
+        # bloquea las filas hasta el commit (MySQL) para que nadie las
+        # mueva entre esta lectura y el UPDATE
+        .with_for_update()
+    )
+
+    deltas: Dict[Tuple[int, str, str], list] = defaultdict(lambda: [0, Decimal(0)])
+    for owner_user_id, old_stage, currency, count, amount in groups:
+        amount = Decimal(str(amount))
+        deltas[(owner_user_id, old_stage, currency)][0] -= count
+        deltas[(owner_user_id, old_stage, currency)][1] -= amount
+        deltas[(owner_user_id, stage, currency)][0] += count
+        deltas[(owner_user_id, stage, currency)][1] += amount
+
+    apply_deltas(db, deltas)
+
+
+def apply_deltas(db, deltas: Dict[Tuple[int, str, str], list]) -> None:
+    """
+    Suma {(owner, stage, currency): [count, amount]} al rollup, creando las
+    filas que no existan. En MySQL/SQLite es un único upsert multi-fila.
+    """
+    table = Aggregate.__table__
+    rows = [
+        {
+            "owner_user_id": owner_user_id,
+            "stage": stage,
+            "currency": currency,
+            "deal_count": count,
+            "total_amount": amount,
+        }
+        for (owner_user_id, stage, currency), (count, amount) in deltas.items()
+        if count or amount
+    ]
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "mysql":
+        stmt = mysql.insert(table).values(rows)
+        db.execute(
+            stmt.on_duplicate_key_update(
+                deal_count=table.c.deal_count + stmt.inserted.deal_count,
+                total_amount=table.c.total_amount + stmt.inserted.total_amount,
+            )
+        )
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(table).values(rows)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["owner_user_id", "stage", "currency"],
+                set_={
+                    "deal_count": table.c.deal_count + stmt.excluded.deal_count,
+                    "total_amount": table.c.total_amount + stmt.excluded.total_amount,
+                },
+            )
+        )
+    else:
+        for values in rows:
+            result = db.execute(
+                update(table)
+                .where(
+                    table.c.owner_user_id == values["owner_user_id"],
+                    table.c.stage == values["stage"],
+                    table.c.currency == values["currency"],
+                )
+                .values(
+                    deal_count=table.c.deal_count + values["deal_count"],
+                    total_amount=table.c.total_amount + values["total_amount"],
+                )
+            )
+            if result.rowcount == 0:
+                db.execute(insert(table).values(**values))
+
+
+def pipeline_by_stage(db, owner_user_id: Optional[int] = None):
+    """Filas (stage, count, total_amount) leídas del rollup."""
+    query = db.query(
+        Aggregate.stage.label("stage"),
+        func.sum(Aggregate.deal_count).label("count"),
+        func.coalesce(func.sum(Aggregate.total_amount), 0).label("total_amount"),
+    )
+    if owner_user_id:
+        query = query.filter(Aggregate.owner_user_id == owner_user_id)
+
+    return (
+        query
+        .group_by(Aggregate.stage)
+        .having(func.sum(Aggregate.deal_count) > 0)
+        .all()
+    )
+
+
+def rebuild_pipeline_aggregates(db) -> None:
+    """Recalcula el rollup completo a partir de `deals` en una transacción."""
+    Deal = models.Deal
+    owner = func.coalesce(Deal.owner_user_id, 0)
+    source = (
+        select(
+            owner,
+            Deal.stage,
+            Deal.currency,
+            func.count(Deal.id),
+            func.coalesce(func.sum(Deal.amount), 0),
+        )
+        .group_by(owner, Deal.stage, Deal.currency)
+    )
+
+    db.execute(delete(Aggregate))
+    db.execute(
+        insert(Aggregate).from_select(
+            ["owner_user_id", "stage", "currency", "deal_count", "total_amount"],
+            source,
+        )
+    )
+    db.commit()
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal, engine
+
+    Aggregate.__table__.create(engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        rebuild_pipeline_aggregates(db)
+    finally:
+        db.close()
+    print("pipeline_aggregates recalculado")
@@ -0,0 +1,55 @@
+"""
+Lectura por lotes (`GET /<entidad>/batch?ids=3,1,2`).
+
+Resuelve todos los ids con una sola query `WHERE id IN (...)` y devuelve
+las filas en el orden pedido, más la lista de ids que no existen, en vez
+de una request (y una query) por tarjeta en el front.
+"""
+from typing import Callable, List, Tuple, TypeVar
+
+from fastapi import HTTPException, status
+
+MAX_BATCH_IDS = 500
+
+T = TypeVar("T")
+
+
+def parse_ids(ids: str) -> List[int]:
+    """`"3,1,2"` -> `[3, 1, 2]` (sin repetidos, en el orden pedido)."""
+    try:
+        parsed = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must be a comma-separated list of integers",
+        )
+    return unique_ids(parsed)
+
+
+def unique_ids(ids: List[int]) -> List[int]:
+    """Quita repetidos (conservando el orden) y limita el tamaño del lote."""
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_IDS} ids per request",
+        )
+    return ids
+
+
+def fetch_batch(
+    query,
+    id_column,
+    ids: List[int],
+    to_out: Callable[..., T] = lambda row: row,
+) -> Tuple[List[T], List[int]]:
+    """
+    Ejecuta `query` filtrada por `id_column IN ids` y devuelve
+    (filas en el orden de `ids`, ids que no existen).
+    """
+    if not ids:
+        return [], []
+    by_id = {row.id: row for row in query.filter(id_column.in_(ids))}
+    items = [to_out(by_id[i]) for i in ids if i in by_id]
+    missing = [i for i in ids if i not in by_id]
+    return items, missing
@@ -0,0 +1,160 @@
+"""
+Caché de respuestas en memoria con TTL y límite LRU.
+
+Se usa en los endpoints que se leen mucho más de lo que cambian
+(`/dashboard/summary`, `/companies/{id}/detail`, `/contacts/{id}/detail`).
+La clave es el endpoint + sus parámetros de path/query. Cada entrada lleva
+etiquetas (`dashboard`, `company:5`, `contact:7`, ...) y los handlers de
+escritura invalidan las etiquetas afectadas después del commit. Si el
+endpoint pone un ETag se guarda con la entrada, así los aciertos de caché
+también responden 304 a `If-None-Match`.
+
+La caché es por proceso: con varios workers cada uno tiene la suya y el TTL
+acota cuánto puede tardar en verse un cambio hecho en otro worker.
+"""
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from fastapi import Response
+
+from app.config import (
+    CACHE_MAX_ENTRIES,
+    CACHE_TTL_SECONDS,
+    NAME_CACHE_MAX_ENTRIES,
+    NAME_CACHE_TTL_SECONDS,
+)
+from app.etag import respond_if_unchanged
+
+# parámetros del endpoint que no forman parte de la clave
+_NON_KEY_PARAMS = {"db", "request", "response"}
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, object, Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+        # sube con cada invalidación: un valor calculado antes de una
+        # invalidación puede estar ya obsoleto y no se guarda
+        self.generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Optional[object]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(
+        self,
+        key: Hashable,
+        value: object,
+        tags: Iterable[str] = (),
+        generation: Optional[int] = None,
+    ) -> None:
+        tags = tuple(tags)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, *tags: str) -> None:
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+response_cache = TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+
+# nombres de entidades relacionadas (ver app/names.py), con las mismas etiquetas
+name_cache = TTLCache(maxsize=NAME_CACHE_MAX_ENTRIES, ttl=NAME_CACHE_TTL_SECONDS)
+
+
+def tag(kind: str, entity_id: Optional[int]) -> Optional[str]:
+    """Etiqueta de una entidad (`company:5`), o None si no hay id."""
+    return f"{kind}:{entity_id}" if entity_id is not None else None
+
+
+def invalidate(*tags: Optional[str]) -> None:
+    """Invalida las etiquetas dadas (las None se ignoran)."""
+    tags = tuple(t for t in tags if t)
+    response_cache.invalidate(*tags)
+    name_cache.invalidate(*tags)
+
+
+def cached_response(tags: Callable[[dict, object], Iterable[str]]):
+    """
+    Cachea el resultado de un endpoint async.
+    `tags(params, result)` devuelve las etiquetas de invalidación de la entrada.
+    """
+
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            if not response_cache.enabled:
+                return await endpoint(*args, **kwargs)
+
+            params = {k: v for k, v in kwargs.items() if k not in _NON_KEY_PARAMS}
+            key = (endpoint.__module__, endpoint.__name__, tuple(sorted(params.items())))
+            request, response = kwargs.get("request"), kwargs.get("response")
+
+            hit, entry = response_cache.get(key)
+            if hit:
+                value, etag = entry
+                if etag and response is not None:
+                    unchanged = respond_if_unchanged(request, response, etag)
+                    if unchanged is not None:
+                        return unchanged
+                return value
+
+            generation = response_cache.generation
+            value = await endpoint(*args, **kwargs)
+            if isinstance(value, Response):
+                # p. ej. un 304: no hay body que guardar
+                return value
+
+            etag = response.headers.get("etag") if response is not None else None
+            response_cache.set(key, (value, etag), tags(params, value), generation)
+            return value
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,242 @@
+"""
+Registro de cambios (`change_log`) para el feed `GET /changes`.
+
+El front mantenía su store al día releyendo los listados enteros cada pocos
+segundos. Con el feed pide solo lo que ha cambiado desde su último token:
+cada alta, cambio o baja de compañías, contactos, deals y actividades deja
+una fila en `change_log` en la misma transacción que el cambio, así que si
+la transacción hace rollback tampoco queda rastro en el log.
+
+- Las escrituras por el ORM (handlers CRUD) se anotan solas con el
+  listener `after_flush` de este módulo.
+- Las sentencias Core que no pasan por el ORM (`PATCH /deals/stage`, las
+  importaciones y los upserts) llaman a `record_changes_from` con el filtro
+  de las filas que tocan.
+
+Lo anotado se escribe en `change_log` en `before_commit`, justo antes del
+COMMIT y con la hora de ese momento, no al hacer flush: una transacción
+que tarde en hacer commit después de escribir no deja en el log un id
+antiguo con una hora antigua.
+
+El token es el `id` del log. Los ids se asignan al insertar y no al hacer
+commit, así que dos transacciones pueden hacer visible un id menor después
+de otro mayor; por eso `read_changes` no avanza el token más allá de los
+cambios de los últimos `CRM_CHANGE_FEED_SETTLE_SECONDS` (se vuelven a
+mandar en la siguiente llamada; para el cliente aplicar un cambio dos veces
+no tiene efecto). Como el log se escribe en `before_commit`, la ventana
+solo tiene que cubrir el INSERT del log más el COMMIT (milisegundos) y el
+desfase de reloj entre workers (la hora la pone la app, en UTC). El feed
+se lee del primario y no de las réplicas: su retraso no está acotado por
+la ventana.
+
+El log crece con cada escritura; el job de limpieza borra lo antiguo:
+
+    python -m app.changes --keep-days 30
+
+Cada limpieza anota en `change_log_prunes` hasta qué id borró; un token
+anterior recibe 410 y el cliente debe recargar entero.
+"""
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import CHANGE_FEED_SETTLE_SECONDS
+from app.models import utcnow
+
+ChangeLog = models.ChangeLog
+ChangeLogPrune = models.ChangeLogPrune
+
+ENTITY_MODELS = {
+    "company": models.Company,
+    "contact": models.Contact,
+    "deal": models.Deal,
+    "activity": models.Activity,
+}
+_ENTITY_BY_MODEL = {model: entity for entity, model in ENTITY_MODELS.items()}
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+# cambios de la transacción en curso, pendientes de escribir en el commit
+_PENDING = "change_log_pending"
+
+
+def _pending(session) -> dict:
+    return session.info.setdefault(_PENDING, {"rows": {}, "selects": []})
+
+
+@event.listens_for(Session, "after_flush")
+def _log_flushed_changes(session, flush_context) -> None:
+    """Anota los objetos del flush (new/dirty/deleted siguen intactos aquí)."""
+    changes: Dict[Tuple[str, int], str] = _pending(session)["rows"]
+    for obj in session.new:
+        entity = _ENTITY_BY_MODEL.get(type(obj))
+        if entity:
+            changes[(entity, obj.id)] = UPSERT
+    for obj in session.dirty:
+        entity = _ENTITY_BY_MODEL.get(type(obj))
+        if entity and session.is_modified(obj, include_collections=False):
+            changes[(entity, obj.id)] = UPSERT
+    for obj in session.deleted:
+        entity = _ENTITY_BY_MODEL.get(type(obj))
+        if entity:
+            changes[(entity, obj.id)] = DELETE
+
+
+def record_changes_from(db, model, *criteria) -> None:
+    """
+    Anota como altas/cambios las filas de `model` que cumplen `criteria`
+    (se escriben con un solo INSERT ... SELECT al hacer commit). Para las
+    escrituras Core que el listener no ve. El filtro se evalúa en el commit,
+    así que tiene que seguir casando después de la escritura.
+    """
+    _pending(db)["selects"].append((model, criteria))
+
+
+@event.listens_for(Session, "before_commit")
+def _write_change_log(session) -> None:
+    # el commit hace flush después de este evento: lo adelantamos para que
+    # after_flush anote también lo que quede pendiente
+    session.flush()
+    pending = session.info.pop(_PENDING, None)
+    if not pending:
+        return
+
+    now = utcnow()
+    # por la conexión: un session.execute aquí podría disparar otro flush
+    conn = session.connection()
+    if pending["rows"]:
+        conn.execute(
+            insert(ChangeLog.__table__),
+            [
+                {"entity": entity, "entity_id": entity_id, "op": op, "changed_at": now}
+                for (entity, entity_id), op in pending["rows"].items()
+            ],
+        )
+    for model, criteria in pending["selects"]:
+        source = select(
+            literal(_ENTITY_BY_MODEL[model], type_=ChangeLog.entity.type),
+            model.id,
+            literal(UPSERT, type_=ChangeLog.op.type),
+            literal(now, type_=ChangeLog.changed_at.type),
+        ).where(*criteria)
+        conn.execute(
+            insert(ChangeLog.__table__).from_select(
+                ["entity", "entity_id", "op", "changed_at"], source
+            )
+        )
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_pending(session, transaction) -> None:
+    # rollback de la transacción principal: lo anotado no llegó a la base de datos
+    if transaction.parent is None:
+        session.info.pop(_PENDING, None)
+
+
+def _settled_before():
+    return utcnow() - timedelta(seconds=CHANGE_FEED_SETTLE_SECONDS)
+
+
+def current_token(db) -> int:
+    """Token desde el que empezar a seguir cambios (después de la carga inicial)."""
+    token = (
+        db.query(ChangeLog.id)
+        .filter(ChangeLog.changed_at <= _settled_before())
+        .order_by(ChangeLog.id.desc())
+        .limit(1)
+        .scalar()
+    )
+    return token or 0
+
+
+def token_expired(db, since: int) -> bool:
+    """
+    True si la limpieza ya borró cambios posteriores a `since`. Se compara
+    con lo que dejó anotado la limpieza y no con el id más bajo del log:
+    los ids pueden tener huecos (rollbacks, `auto_increment_increment`).
+    """
+    pruned_through = db.query(func.max(ChangeLogPrune.pruned_through)).scalar()
+    return pruned_through is not None and since < pruned_through
+
+
+def read_changes(
+    db, since: int, limit: int
+) -> Tuple[Dict[Tuple[str, int], str], int, bool]:
+    """
+    Hasta `limit` entradas del log posteriores a `since`, reducidas a la
+    última operación por entidad: ({(entity, id): op}, next_token, has_more).
+    """
+    rows = (
+        db.query(ChangeLog.id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op,
+                 ChangeLog.changed_at)
+        .filter(ChangeLog.id > since)
+        .order_by(ChangeLog.id)
+        .limit(limit + 1)
+        .all()
+    )
+    page = rows[:limit]
+
+    settled = _settled_before()
+    next_token = since
+    for row in page:
+        if row.changed_at > settled:
+            break
+        next_token = row.id
+    # si el token no llega al final de la página, lo que falta aún no se puede
+    # dar por cerrado: el cliente vuelve en su siguiente sondeo, no enseguida
+    has_more = len(rows) > limit and bool(page) and next_token == page[-1].id
+
+    changes: Dict[Tuple[str, int], str] = {}
+    for row in page:
+        changes[(row.entity, row.entity_id)] = row.op
+    return changes, next_token, has_more
+
+
+def ids_by_entity(
+    changes: Dict[Tuple[str, int], str], op: str
+) -> Dict[str, List[int]]:
+    """{entity: [ids]} de las entradas con la operación `op`."""
+    grouped: Dict[str, List[int]] = {entity: [] for entity in ENTITY_MODELS}
+    for (entity, entity_id), entry_op in changes.items():
+        if entry_op == op:
+            grouped[entity].append(entity_id)
+    return grouped
+
+
+def prune_changes(db, keep_days: int) -> int:
+    """Borra las entradas con más de `keep_days` días. Hace commit."""
+    cutoff = utcnow() - timedelta(days=keep_days)
+    last_id: Optional[int] = (
+        db.query(ChangeLog.id)
+        .filter(ChangeLog.changed_at < cutoff)
+        .order_by(ChangeLog.id.desc())
+        .limit(1)
+        .scalar()
+    )
+    if last_id is None:
+        return 0
+    result = db.execute(delete(ChangeLog).where(ChangeLog.id <= last_id))
+    db.add(ChangeLogPrune(pruned_through=last_id))
+    db.commit()
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Limpieza del change_log")
+    parser.add_argument("--keep-days", type=int, default=30)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        count = prune_changes(db, args.keep_days)
+    finally:
+        db.close()
+    print(f"change_log: {count} filas borradas")
@@ -0,0 +1,88 @@
+"""
+Configuración de la aplicación.
+
+Los valores por defecto son los de desarrollo; en cada entorno se pueden
+sobreescribir con variables de entorno `CRM_*`.
+"""
+import os
+from typing import List
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_list(name: str) -> List[str]:
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+
+# ⚠ Si cambiaste usuario/contraseña, cámbialo aquí (o en el entorno):
+DB_USER = os.getenv("CRM_DB_USER", "crm_user")  # USUARIO DE LA BASE DE DATOS
+DB_PASSWORD = os.getenv("CRM_DB_PASSWORD", "crmPassword123!")  # CONTRASEÑA DE LA BBDD
+DB_HOST = os.getenv("CRM_DB_HOST", "localhost")  # HOST
+DB_NAME = os.getenv("CRM_DB_NAME", "crm_db")  # NOMBRE BASE DE DATOS
+
+# Modo async: AsyncSession + driver async de MySQL y endpoints `async def`
+DB_ASYNC = env_bool("CRM_DB_ASYNC")
+
+DATABASE_URL = os.getenv(
+    "CRM_DATABASE_URL",
+    f"mysql+mysqlconnector://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}",
+)
+ASYNC_DATABASE_URL = os.getenv(
+    "CRM_ASYNC_DATABASE_URL",
+    f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}",
+)
+
+# Pool de conexiones (por proceso). Con picos de tráfico, pool_size +
+# max_overflow es el máximo de conexiones abiertas; una request espera hasta
+# pool_timeout segundos a que se libere una. pool_recycle (segundos) renueva
+# las conexiones antes de que MySQL las cierre por wait_timeout.
+DB_POOL_SIZE = int(os.getenv("CRM_DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("CRM_DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("CRM_DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("CRM_DB_POOL_RECYCLE", "1800"))
+
+# Réplicas de lectura (opcional): DSNs separados por comas. Los GET leen de
+# ellas (CRM_DB_REPLICA_STRATEGY = round_robin | least_connections) salvo
+# durante READ_YOUR_WRITES_SECONDS después de que el cliente escriba.
+DATABASE_REPLICA_URLS = env_list("CRM_DATABASE_REPLICA_URLS")
+ASYNC_DATABASE_REPLICA_URLS = env_list("CRM_ASYNC_DATABASE_REPLICA_URLS")
+DB_REPLICA_STRATEGY = os.getenv("CRM_DB_REPLICA_STRATEGY", "round_robin")
+READ_YOUR_WRITES_SECONDS = float(os.getenv("CRM_READ_YOUR_WRITES_SECONDS", "5"))
+
+# Muestra el SQL en consola (útil para depurar; muy caro con tráfico real)
+DB_ECHO = env_bool("CRM_DB_ECHO")
+
+# Instrumentación SQL por request (cabecera Server-Timing + log estructurado).
+# Muestreo global y por prefijo de ruta: "/dashboard=1.0,/deals/export=0"
+SQL_TIMING_SAMPLE_RATE = float(os.getenv("CRM_SQL_TIMING_SAMPLE_RATE", "1.0"))
+SQL_TIMING_ROUTE_RATES = os.getenv("CRM_SQL_TIMING_ROUTE_RATES", "")
+
+# Caché de respuestas en memoria (dashboard y vistas de detalle).
+# TTL en segundos (0 = desactivada) y nº máximo de entradas (LRU).
+CACHE_TTL_SECONDS = float(os.getenv("CRM_CACHE_TTL_SECONDS", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CRM_CACHE_MAX_ENTRIES", "1024"))
+
+# Nombres de compañías/contactos para las respuestas de escritura (app/names.py)
+NAME_CACHE_TTL_SECONDS = float(os.getenv("CRM_NAME_CACHE_TTL_SECONDS", "300"))
+NAME_CACHE_MAX_ENTRIES = int(os.getenv("CRM_NAME_CACHE_MAX_ENTRIES", "10000"))
+
+# Feed de cambios (GET /changes): el token no pasa de los cambios con menos
+# de estos segundos, por si una transacción con un id menor aún no ha
+# terminado el commit. El log se escribe justo antes del COMMIT (ver
+# app/changes.py): basta con cubrir el COMMIT y el desfase de reloj entre
+# workers.
+CHANGE_FEED_SETTLE_SECONDS = float(os.getenv("CRM_CHANGE_FEED_SETTLE_SECONDS", "5"))
+
+# Eventos en tiempo real (GET /events, SSE). Con CRM_EVENTS_REDIS_URL (y el
+# paquete `redis`) los eventos se reparten entre workers por pub/sub; sin él,
+# solo llegan a los clientes conectados al mismo proceso.
+EVENTS_REDIS_URL = os.getenv("CRM_EVENTS_REDIS_URL", "")
+EVENTS_CHANNEL = os.getenv("CRM_EVENTS_CHANNEL", "crm:events")
+# eventos pendientes por cliente; si se llena, se descartan y se le manda `resync`
+EVENTS_QUEUE_SIZE = int(os.getenv("CRM_EVENTS_QUEUE_SIZE", "100"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("CRM_EVENTS_HEARTBEAT_SECONDS", "15"))
@@ -1,25 +1,109 @@
-from sqlalchemy import create_engine
+import functools
+
+from fastapi import HTTPException, status
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from starlette.concurrency import run_in_threadpool
 
+from app.config import (
+    ASYNC_DATABASE_REPLICA_URLS,
+    ASYNC_DATABASE_URL,
+    DATABASE_REPLICA_URLS,
+    DATABASE_URL,
+    DB_ASYNC,
+    DB_ECHO,
+    DB_REPLICA_STRATEGY,
+)
+from app.pool import pool_options
+from app.replicas import Replica, ReplicaSet, prefer_primary
 
-# ⚠ Si cambiaste usuario/contraseña, cámbialo aquí:
-DB_USER = "crm_user" # USUARIO DE LA BASE DE DATOS 
-DB_PASSWORD = "crmPassword123!" # CONTRASEÑA DE LA BBDD
-DB_HOST = "localhost" #~HOST 
-DB_NAME = "crm_db" #NOMBRE BASE DE DATOS 
 
-DATABASE_URL = (
-    f"mysql+mysqlconnector://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"  # CREAMOS EL CONECTOR PARA LLAMAR LA BBDD
-)
+def utc_sessions(engine):
+    """
+    En MySQL pone cada conexión en `time_zone = '+00:00'`. La app escribe
+    created_at/updated_at en UTC (models.utcnow), pero los server_default
+    (CURRENT_TIMESTAMP) usan la zona de la sesión: en un servidor que no
+    esté en UTC las filas de uno y otro origen se desfasarían y fallarían
+    los ETag, las versiones de detalle y la espera del feed de cambios.
+    Sirve para motores síncronos y async. Devuelve el mismo motor.
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if sync_engine.dialect.name == "mysql":
 
-engine = create_engine(
-    DATABASE_URL,
-    echo=True,          # Muestra SQL en consola (útil para depurar)
-    pool_pre_ping=True  # Evita conexiones muertas
-)
+        @event.listens_for(sync_engine, "connect")
+        def _set_utc(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("SET time_zone = '+00:00'")
+            cursor.close()
+
+    return engine
+
+
+engine = utc_sessions(create_engine(
+    DATABASE_URL,  # CONECTOR PARA LLAMAR LA BBDD (ver app/config.py)
+    echo=DB_ECHO,       # Muestra SQL en consola (CRM_DB_ECHO=1)
+    pool_pre_ping=True,  # Evita conexiones muertas
+    **pool_options(DATABASE_URL),  # tamaño/timeouts del pool + métricas
+))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Motor async (solo con CRM_DB_ASYNC=1). El motor síncrono se mantiene para
+# los comandos de mantenimiento (python -m app.aggregates, app.search, ...).
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    async_engine = utc_sessions(create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=DB_ECHO,
+        pool_pre_ping=True,
+        **pool_options(ASYNC_DATABASE_URL, is_async=True),
+    ))
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine,
+        class_=AsyncSession,
+        autoflush=False,
+    )
+
+# Réplicas de lectura (CRM_DATABASE_REPLICA_URLS), ver app/replicas.py
+read_replicas = ReplicaSet(
+    [
+        Replica(
+            replica_engine,
+            sessionmaker(autocommit=False, autoflush=False, bind=replica_engine),
+        )
+        for replica_engine in (
+            utc_sessions(
+                create_engine(url, echo=DB_ECHO, pool_pre_ping=True, **pool_options(url))
+            )
+            for url in DATABASE_REPLICA_URLS
+        )
+    ],
+    DB_REPLICA_STRATEGY,
+)
+async_read_replicas = ReplicaSet([], DB_REPLICA_STRATEGY)
+if DB_ASYNC:
+    async_read_replicas = ReplicaSet(
+        [
+            Replica(
+                replica_engine,
+                async_sessionmaker(bind=replica_engine, class_=AsyncSession, autoflush=False),
+            )
+            for replica_engine in (
+                utc_sessions(create_async_engine(
+                    url,
+                    echo=DB_ECHO,
+                    pool_pre_ping=True,
+                    **pool_options(url, is_async=True),
+                ))
+                for url in ASYNC_DATABASE_REPLICA_URLS
+            )
+        ],
+        DB_REPLICA_STRATEGY,
+    )
+
 Base = declarative_base()
 
 
@@ -30,3 +114,98 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Igual que get_db pero con una AsyncSession."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def read_sessionmaker():
+    """
+    sessionmaker para una lectura: una réplica si hay, salvo que la request
+    deba leer del primario (escrituras y read-your-writes).
+    """
+    replicas = async_read_replicas if DB_ASYNC else read_replicas
+    primary = AsyncSessionLocal if DB_ASYNC else SessionLocal
+    if prefer_primary():
+        return primary
+    return replicas.choose() or primary
+
+
+def get_read_db():
+    """Como get_db, pero en una réplica de lectura si hay (solo para GET)."""
+    db = read_sessionmaker()()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db():
+    """Como get_async_db, pero en una réplica de lectura si hay."""
+    async with read_sessionmaker()() as db:
+        yield db
+
+
+# Dependencies que usan los routers, según la configuración
+get_session = get_async_db if DB_ASYNC else get_db
+get_read_session = get_async_read_db if DB_ASYNC else get_read_db
+
+
+def async_endpoint(handler):
+    """
+    Convierte un handler síncrono que recibe `db` en un endpoint `async def`.
+
+    - Con AsyncSession el handler corre con `run_sync`: las queries esperan
+      en el event loop sin ocupar un hilo, así un worker puede tener cientos
+      de queries en vuelo.
+    - Con Session síncrona corre en el threadpool, como antes.
+
+    El código de las queries es el mismo en los dos modos.
+    """
+
+    @functools.wraps(handler)
+    async def endpoint(*args, **kwargs):
+        db = kwargs.pop("db")
+        return await run_with_session(
+            db, lambda session: handler(*args, db=session, **kwargs)
+        )
+
+    return endpoint
+
+
+async def run_with_session(db, fn, *args, **kwargs):
+    """
+    Ejecuta `fn(session, *args, **kwargs)` con la Session síncrona que
+    corresponda a `db` (AsyncSession vía run_sync, Session en el threadpool).
+    Útil en endpoints que ya son async (p. ej. los que leen el body en stream).
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+def _is_duplicate(exc: IntegrityError) -> bool:
+    # MySQL (1062): "Duplicate entry ..."; SQLite: "UNIQUE constraint failed: ..."
+    message = str(exc.orig)
+    return "Duplicate entry" in message or "UNIQUE constraint" in message
+
+
+def flush_or_400(db, duplicate_detail: str = "Duplicate record") -> None:
+    """
+    flush de los cambios pendientes. La unicidad (nombre de compañía, email
+    de contacto) la garantiza la restricción de la BD en vez de un SELECT
+    previo: si se viola, o si una FK apunta a algo que no existe, se hace
+    rollback y se responde 400.
+    """
+    try:
+        db.flush()
+    except IntegrityError as exc:
+        db.rollback()
+        if _is_duplicate(exc):
+            detail = duplicate_detail
+        else:
+            detail = "Invalid reference to a related record"
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
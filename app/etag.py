@@ -0,0 +1,63 @@
+"""
+ETags débiles y GET condicionales (`If-None-Match` -> 304).
+
+La versión de un recurso se deriva de sus `updated_at` (y, en las vistas de
+detalle, del máximo `updated_at` y el nº de filas de sus colecciones), así
+se puede comprobar con una query mínima sin reconstruir ni serializar la
+respuesta completa.
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+
+def weak_etag(*parts) -> str:
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(request: Optional[Request], etag: str) -> bool:
+    """Comparación débil de `If-None-Match` con `etag` (RFC 7232)."""
+    if request is None:
+        return False
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = _opaque(etag)
+    return any(_opaque(t) == wanted for t in header.split(","))
+
+
+def wants_revalidation(request: Optional[Request]) -> bool:
+    return request is not None and "if-none-match" in request.headers
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    # el navegador puede guardar la respuesta pero debe revalidarla siempre
+    response.headers["Cache-Control"] = "no-cache"
+
+
+def not_modified(etag: str) -> Response:
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_etag(response, etag)
+    return response
+
+
+def respond_if_unchanged(
+    request: Optional[Request],
+    response: Response,
+    etag: str,
+) -> Optional[Response]:
+    """304 si el cliente ya tiene `etag`; si no, se añade a la respuesta y None."""
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    return None
@@ -0,0 +1,203 @@
+"""
+Eventos en tiempo real de deals y actividades (`GET /events`, SSE).
+
+Los dashboards sondeaban `/dashboard/summary` y `/deals/` cada pocos
+segundos para enterarse de los cambios de etapa. Ahora los handlers de
+escritura de deals y actividades publican un evento después del commit
+(`deal.created`, `deal.updated`, `deal.deleted`, `activity.*`) y cada
+cliente conectado a `/events` lo recibe al momento.
+
+- `EventHub` reparte en el event loop del worker a los clientes conectados.
+  Cada cliente tiene una cola acotada (`CRM_EVENTS_QUEUE_SIZE`); si no lee
+  a tiempo se descartan sus eventos pendientes y recibe uno `resync` (debe
+  recargar lo que muestre) en vez de acumular memoria.
+- Los handlers síncronos corren en el threadpool: `publish` pasa el evento
+  al loop con `call_soon_threadsafe`.
+- Backend: con `CRM_EVENTS_REDIS_URL` los eventos van por pub/sub de Redis
+  y llegan a los clientes de todos los workers; sin él (o sin el paquete
+  `redis`) se reparten solo dentro del proceso.
+
+El hub se arranca en el lifespan de la app (app/main.py); fuera de ella
+(scripts, jobs) `publish` no hace nada.
+"""
+import asyncio
+import json
+import logging
+from typing import Callable, Iterable, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+
+from app.config import EVENTS_CHANNEL, EVENTS_QUEUE_SIZE, EVENTS_REDIS_URL
+
+logger = logging.getLogger("app.events")
+
+RESYNC = "resync"
+
+Deliver = Callable[[dict], None]
+
+
+class Subscriber:
+    """Un cliente conectado a `/events`, opcionalmente filtrado por comercial."""
+
+    def __init__(self, owner_user_id: Optional[int], queue_size: int):
+        self.owner_user_id = owner_user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def wants(self, event: dict) -> bool:
+        return (
+            event["type"] == RESYNC
+            or self.owner_user_id is None
+            or self.owner_user_id in event["owners"]
+        )
+
+    def put(self, event: dict) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": RESYNC, "owners": [], "data": {}})
+
+
+class LocalBackend:
+    """Un solo proceso: publicar es repartir directamente."""
+
+    local = True
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    def publish(self, event: dict) -> None:
+        self._deliver(event)
+
+    async def stop(self) -> None:
+        pass
+
+
+class RedisBackend:
+    """Pub/sub de Redis: cada worker publica en el canal y reparte lo que lee."""
+
+    local = False
+
+    def __init__(self, redis_module, url: str, channel: str):
+        self._redis = redis_module
+        self.url = url
+        self.channel = channel
+        self._client = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._client = self._redis.from_url(self.url)
+        self._listener = asyncio.create_task(self._listen(deliver))
+
+    def publish(self, event: dict) -> None:
+        task = asyncio.ensure_future(
+            self._client.publish(self.channel, json.dumps(event))
+        )
+        task.add_done_callback(_log_publish_error)
+
+    async def _listen(self, deliver: Deliver) -> None:
+        while True:
+            try:
+                async with self._client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            deliver(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # los eventos de mientras se pierden: que los clientes recarguen
+                logger.exception("events: Redis subscription lost, retrying")
+                deliver({"type": RESYNC, "owners": [], "data": {}})
+                await asyncio.sleep(1)
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+
+
+def _log_publish_error(task: asyncio.Future) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("events: Redis publish failed: %s", task.exception())
+
+
+def make_backend(url: str = EVENTS_REDIS_URL, channel: str = EVENTS_CHANNEL):
+    if not url:
+        return LocalBackend()
+    try:
+        import redis.asyncio as redis_asyncio
+    except ImportError:  # pragma: no cover - dependencia opcional
+        logger.warning(
+            "events: CRM_EVENTS_REDIS_URL is set but the redis package is "
+            "missing; events stay in this process"
+        )
+        return LocalBackend()
+    return RedisBackend(redis_asyncio, url, channel)
+
+
+class EventHub:
+    """Clientes conectados a este worker y el backend por el que llegan los eventos."""
+
+    def __init__(self, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Set[Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._backend = None
+
+    async def start(self, backend=None) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._backend = backend or make_backend()
+        await self._backend.start(self._dispatch)
+
+    async def stop(self) -> None:
+        if self._backend is not None:
+            await self._backend.stop()
+        self._loop = None
+        self._backend = None
+
+    def subscribe(self, owner_user_id: Optional[int] = None) -> Subscriber:
+        subscriber = Subscriber(owner_user_id, self.queue_size)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    def _dispatch(self, event: dict) -> None:
+        for subscriber in list(self._subscribers):
+            if subscriber.wants(event):
+                subscriber.put(event)
+
+    def publish(self, event_type: str, data, owners: Iterable[Optional[int]]) -> None:
+        """
+        Publica un evento (desde el loop o desde cualquier hilo). `owners`:
+        comerciales afectados, para el filtro `owner_user_id` (en un cambio
+        de comercial, el anterior y el nuevo).
+        """
+        loop, backend = self._loop, self._backend
+        if loop is None or (backend.local and not self._subscribers):
+            return
+        event = {
+            "type": event_type,
+            "owners": sorted({o for o in owners if o}),
+            "data": jsonable_encoder(data),
+        }
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            backend.publish(event)
+        else:
+            loop.call_soon_threadsafe(backend.publish, event)
+
+
+hub = EventHub()
+
+
+def format_sse(event: dict) -> str:
+    """Evento en formato text/event-stream (sin el filtro `owners`)."""
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
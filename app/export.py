@@ -0,0 +1,262 @@
+"""
+Exportación completa en stream (CSV o NDJSON) de deals, contactos y
+actividades.
+
+Las filas se leen con un cursor del lado del servidor (`yield_per`, que
+activa `stream_results`) y se envían por bloques a través de un
+`StreamingResponse`, así la memoria se mantiene plana sea cual sea el
+tamaño de la tabla. La exportación abre su propia sesión porque la de la
+request se cierra antes de empezar a enviar el body.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Iterator, List, Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from app import database, models
+
+BATCH_SIZE = 1000
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _full_name(first: Optional[str], last: Optional[str]) -> Optional[str]:
+    if first is None and last is None:
+        return None
+    return f"{first} {last}"
+
+
+# ---------- CONSULTAS ----------
+DEAL_FIELDS = [
+    "id", "title", "amount", "currency", "stage", "close_date",
+    "company_id", "company_name", "contact_id", "contact_name",
+    "owner_user_id", "created_at", "updated_at",
+]
+
+
+def deals_statement(
+    stage: Optional[str] = None,
+    company_id: Optional[int] = None,
+    owner_user_id: Optional[int] = None,
+):
+    Deal, Company, Contact = models.Deal, models.Company, models.Contact
+    stmt = (
+        select(
+            Deal.id, Deal.title, Deal.amount, Deal.currency, Deal.stage,
+            Deal.close_date, Deal.company_id,
+            Company.name.label("company_name"),
+            Deal.contact_id,
+            Contact.first_name.label("contact_first_name"),
+            Contact.last_name.label("contact_last_name"),
+            Deal.owner_user_id, Deal.created_at, Deal.updated_at,
+        )
+        .outerjoin(Company, Deal.company_id == Company.id)
+        .outerjoin(Contact, Deal.contact_id == Contact.id)
+        .order_by(Deal.id)
+    )
+    if stage:
+        stmt = stmt.where(Deal.stage == stage)
+    if company_id:
+        stmt = stmt.where(Deal.company_id == company_id)
+    if owner_user_id:
+        stmt = stmt.where(Deal.owner_user_id == owner_user_id)
+    return stmt
+
+
+def deal_row(row) -> dict:
+    data = row._asdict()
+    data["contact_name"] = _full_name(
+        data.pop("contact_first_name"), data.pop("contact_last_name")
+    )
+    return data
+
+
+CONTACT_FIELDS = [
+    "id", "first_name", "last_name", "email", "phone", "position",
+    "company_id", "company_name", "owner_user_id", "tags",
+    "created_at", "updated_at",
+]
+
+
+def contacts_statement(
+    company_id: Optional[int] = None,
+    owner_user_id: Optional[int] = None,
+):
+    Contact, Company = models.Contact, models.Company
+    stmt = (
+        select(
+            Contact.id, Contact.first_name, Contact.last_name, Contact.email,
+            Contact.phone, Contact.position, Contact.company_id,
+            Company.name.label("company_name"),
+            Contact.owner_user_id, Contact.tags,
+            Contact.created_at, Contact.updated_at,
+        )
+        .outerjoin(Company, Contact.company_id == Company.id)
+        .order_by(Contact.id)
+    )
+    if company_id:
+        stmt = stmt.where(Contact.company_id == company_id)
+    if owner_user_id:
+        stmt = stmt.where(Contact.owner_user_id == owner_user_id)
+    return stmt
+
+
+def contact_row(row) -> dict:
+    return row._asdict()
+
+
+ACTIVITY_FIELDS = [
+    "id", "type", "subject", "notes", "due_date", "done",
+    "deal_id", "deal_title", "contact_id", "contact_name", "company_name",
+    "owner_user_id", "created_at", "updated_at",
+]
+
+
+def activities_statement(
+    due_from: Optional[datetime] = None,
+    due_to: Optional[datetime] = None,
+    owner_user_id: Optional[int] = None,
+    deal_id: Optional[int] = None,
+):
+    Activity, Deal, Contact = models.Activity, models.Deal, models.Contact
+    DealCompany = aliased(models.Company)
+    stmt = (
+        select(
+            Activity.id, Activity.type, Activity.subject, Activity.notes,
+            Activity.due_date, Activity.done,
+            Activity.deal_id, Deal.title.label("deal_title"),
+            Activity.contact_id,
+            Contact.first_name.label("contact_first_name"),
+            Contact.last_name.label("contact_last_name"),
+            DealCompany.name.label("company_name"),
+            Activity.owner_user_id, Activity.created_at, Activity.updated_at,
+        )
+        .outerjoin(Deal, Activity.deal_id == Deal.id)
+        .outerjoin(DealCompany, Deal.company_id == DealCompany.id)
+        .outerjoin(Contact, Activity.contact_id == Contact.id)
+        .order_by(Activity.id)
+    )
+    if due_from:
+        stmt = stmt.where(Activity.due_date >= due_from)
+    if due_to:
+        stmt = stmt.where(Activity.due_date <= due_to)
+    if owner_user_id:
+        stmt = stmt.where(Activity.owner_user_id == owner_user_id)
+    if deal_id:
+        stmt = stmt.where(Activity.deal_id == deal_id)
+    return stmt
+
+
+def activity_row(row) -> dict:
+    data = row._asdict()
+    data["contact_name"] = _full_name(
+        data.pop("contact_first_name"), data.pop("contact_last_name")
+    )
+    return data
+
+
+# ---------- SERIALIZACIÓN ----------
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+class _Encoder:
+    def __init__(self, fmt: str, fields: List[str]):
+        self.fmt = fmt
+        self.fields = fields
+
+    def header(self) -> str:
+        if self.fmt != "csv":
+            return ""
+        return self._csv_lines([self.fields])
+
+    def batch(self, rows: List[dict]) -> str:
+        if self.fmt == "csv":
+            return self._csv_lines(
+                [[_csv_value(r.get(f)) for f in self.fields] for r in rows]
+            )
+        return "".join(
+            json.dumps(
+                {f: r.get(f) for f in self.fields},
+                default=_json_default,
+                separators=(",", ":"),
+            ) + "\n"
+            for r in rows
+        )
+
+    @staticmethod
+    def _csv_lines(rows) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue()
+
+
+def _iter_sync(stmt, to_dict, encoder: _Encoder, session_factory) -> Iterator[bytes]:
+    yield encoder.header().encode()
+    with session_factory() as session:
+        result = session.execute(stmt.execution_options(yield_per=BATCH_SIZE))
+        for partition in result.partitions():
+            yield encoder.batch([to_dict(r) for r in partition]).encode()
+
+
+async def _iter_async(stmt, to_dict, encoder: _Encoder, session_factory):
+    yield encoder.header().encode()
+    async with session_factory() as session:
+        result = await session.stream(stmt.execution_options(yield_per=BATCH_SIZE))
+        async for partition in result.partitions():
+            yield encoder.batch([to_dict(r) for r in partition]).encode()
+
+
+def export_response(
+    stmt,
+    to_dict: Callable,
+    fields: List[str],
+    fmt: str,
+    filename: str,
+) -> StreamingResponse:
+    fmt = (fmt or "csv").lower()
+    if fmt not in MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid format (use csv or ndjson)",
+        )
+
+    encoder = _Encoder(fmt, fields)
+    # la exportación es solo lectura: réplica si hay (ver app/replicas.py)
+    session_factory = database.read_sessionmaker()
+    if database.DB_ASYNC:
+        body = _iter_async(stmt, to_dict, encoder, session_factory)
+    else:
+        body = _iter_sync(stmt, to_dict, encoder, session_factory)
+
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[fmt],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.{fmt}"'
+        },
+    )
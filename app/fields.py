@@ -0,0 +1,46 @@
+"""
+Sparse fieldsets para los listados (`?fields=id,title,amount,stage`).
+
+Con `fields` el listado:
+- solo carga de la BD las columnas pedidas (`load_only`, o directamente
+  esas columnas en deals y actividades), más las que necesita la paginación;
+- solo hace los joins de los nombres enriquecidos (`company_name`, ...) que
+  se hayan pedido;
+- responde solo con esos campos (ver `app.responses.list_response`).
+
+Sin `fields` el listado se comporta como siempre.
+"""
+from typing import Iterable, List, Optional, Tuple, Type
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only
+
+
+def parse_fields(fields: Optional[str], schema: Type[BaseModel]) -> Optional[Tuple[str, ...]]:
+    """`"title,amount"` -> `("id", "title", "amount")`; None si no se pidió."""
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in schema.model_fields]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}",
+        )
+    # el id siempre va: el front lo necesita como clave de fila
+    return tuple(dict.fromkeys(["id", *requested]))
+
+
+def model_columns(model, fields: Iterable[str], *extra) -> List:
+    """Columnas de `model` que están en `fields`, más `extra` (sin repetir)."""
+    fields = list(fields)
+    columns = inspect(model).columns
+    attrs = [getattr(model, f) for f in fields if f in columns]
+    return attrs + [c for c in extra if c.key not in fields]
+
+
+def load_columns(model, fields: Iterable[str], *extra):
+    """`load_only` con las columnas de `model` que están en `fields` + `extra`."""
+    return load_only(*model_columns(model, fields, *extra))
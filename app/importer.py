@@ -0,0 +1,304 @@
+"""
+Importación masiva de contactos y compañías (CSV o NDJSON en stream).
+
+El body se lee y se parsea de forma incremental y se procesa por bloques:
+por cada bloque se valida cada fila, se buscan los duplicados existentes
+con una sola query `IN (...)` y se insertan las filas nuevas con un INSERT
+multi-fila en su propia transacción. Si el bloque choca con alguna
+restricción (p. ej. un `company_id` inexistente) se reintenta fila a fila
+con savepoints para señalar solo las filas culpables.
+"""
+import codecs
+import csv
+import json
+from typing import AsyncIterator, List, Optional, Set, Tuple, Union
+
+from fastapi import HTTPException, Request, status
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app import schemas
+from app.changes import record_changes_from
+from app.database import run_with_session
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_CHUNK_SIZE = 5000
+
+CSV_CONTENT_TYPES = ("text/csv", "application/csv")
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+# (nº de registro, datos) o (nº de registro, mensaje de error de parseo)
+Record = Tuple[int, Union[dict, str]]
+
+
+class ImportState:
+    """Contadores y claves ya vistas durante una importación."""
+
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.errors: List[schemas.ImportRowError] = []
+        self.seen_keys: Set[str] = set()
+
+    def error(self, row: int, message: str) -> None:
+        self.errors.append(schemas.ImportRowError(row=row, error=message))
+
+    def report(self) -> schemas.ImportReport:
+        return schemas.ImportReport(
+            received=self.received,
+            inserted=self.inserted,
+            duplicates=self.duplicates,
+            errors=self.errors,
+        )
+
+
+def detect_format(request: Request, fmt: Optional[str]) -> str:
+    """`csv` o `ndjson`, por parámetro `format` o por Content-Type."""
+    if fmt:
+        fmt = fmt.lower()
+    else:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip()
+        if content_type in CSV_CONTENT_TYPES:
+            fmt = "csv"
+        elif content_type in NDJSON_CONTENT_TYPES:
+            fmt = "ndjson"
+
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Use text/csv or application/x-ndjson (or ?format=csv|ndjson)",
+        )
+    return fmt
+
+
+async def _iter_lines(request: Request) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def _iter_csv(request: Request) -> AsyncIterator[Record]:
+    header: Optional[List[str]] = None
+    row_no = 0
+    buffered = ""
+    async for line in _iter_lines(request):
+        # un campo entre comillas puede contener saltos de línea
+        buffered = f"{buffered}\n{line}" if buffered else line
+        if buffered.count('"') % 2:
+            continue
+        record, buffered = buffered, ""
+        if not record.strip():
+            continue
+
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+
+        row_no += 1
+        if len(values) != len(header):
+            yield row_no, f"expected {len(header)} columns, got {len(values)}"
+        else:
+            yield row_no, dict(zip(header, values))
+
+    if buffered:
+        yield row_no + 1, "unterminated quoted field"
+
+
+async def _iter_ndjson(request: Request) -> AsyncIterator[Record]:
+    row_no = 0
+    async for line in _iter_lines(request):
+        if not line.strip():
+            continue
+        row_no += 1
+        try:
+            data = json.loads(line)
+        except ValueError as exc:
+            yield row_no, f"invalid JSON: {exc}"
+            continue
+        if not isinstance(data, dict):
+            yield row_no, "each line must be a JSON object"
+        else:
+            yield row_no, data
+
+
+def _clean(data: dict, json_fields: Tuple[str, ...]) -> dict:
+    cleaned = {}
+    for key, value in data.items():
+        if isinstance(value, str):
+            value = value.strip() or None
+            if value is not None and key in json_fields:
+                value = json.loads(value)
+        cleaned[key] = value
+    return cleaned
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}"
+        for err in exc.errors()
+    )
+
+
+def _normalize_key(key: Optional[str]) -> Optional[str]:
+    # MySQL compara sin distinguir mayúsculas (collation *_ci) y SQLite no:
+    # normalizamos para que el informe sea el mismo en los dos
+    return key.strip().lower() if key else None
+
+
+def _existing_keys(db, column, keys: List[str]) -> Set[str]:
+    """Claves (normalizadas) de `keys` que ya están en la tabla."""
+    if db.get_bind().dialect.name == "mysql":
+        # la collation ya no distingue mayúsculas y así se usa el índice
+        condition = column.in_(keys)
+    else:
+        condition = func.lower(column).in_(keys)
+    return {_normalize_key(k) for k in db.scalars(select(column).where(condition))}
+
+
+def import_chunk(
+    db,
+    records: List[Record],
+    state: ImportState,
+    *,
+    model,
+    schema,
+    key_field: str,
+    json_fields: Tuple[str, ...] = (),
+) -> None:
+    """Valida, deduplica e inserta un bloque de registros en una transacción."""
+    rows = []
+    chunk_keys: Set[str] = set()
+    # repetidas dentro del bloque: son duplicados solo si la primera se inserta
+    repeated: List[Record] = []
+    for row_no, data in records:
+        if isinstance(data, str):
+            state.error(row_no, data)
+            continue
+        try:
+            obj = schema(**_clean(data, json_fields))
+        except ValidationError as exc:
+            state.error(row_no, _validation_message(exc))
+            continue
+        except ValueError as exc:
+            state.error(row_no, f"invalid value: {exc}")
+            continue
+
+        values = obj.dict()
+        norm = _normalize_key(values.get(key_field))
+        if norm is not None and norm in state.seen_keys:
+            state.duplicates += 1
+            continue
+        if norm is not None and norm in chunk_keys:
+            repeated.append((row_no, data))
+            continue
+        if norm is not None:
+            chunk_keys.add(norm)
+        rows.append((row_no, values, norm))
+
+    # duplicados ya existentes en la tabla: una sola query por bloque
+    if chunk_keys:
+        existing = _existing_keys(db, getattr(model, key_field), list(chunk_keys))
+        if existing:
+            state.seen_keys.update(existing)
+            before = len(rows)
+            rows = [r for r in rows if r[2] not in existing]
+            state.duplicates += before - len(rows)
+
+    if rows:
+        _insert_rows(db, rows, state, model)
+    if repeated:
+        import_chunk(
+            db,
+            repeated,
+            state,
+            model=model,
+            schema=schema,
+            key_field=key_field,
+            json_fields=json_fields,
+        )
+
+
+def _insert_rows(db, rows, state: ImportState, model) -> None:
+    """
+    Inserta las filas del bloque y commit. Las claves pasan a `seen_keys`
+    solo si su fila se ha insertado.
+    """
+    # el INSERT multi-fila no devuelve ids: al change_log van las filas por
+    # encima del máximo actual (si cuela alguna de otra transacción, solo
+    # se manda de más en el feed)
+    last_id = db.query(func.max(model.id)).scalar() or 0
+
+    try:
+        db.execute(insert(model), [values for _, values, _ in rows])
+        record_changes_from(db, model, model.id > last_id)
+        db.commit()
+        state.inserted += len(rows)
+        state.seen_keys.update(norm for _, _, norm in rows if norm is not None)
+        return
+    except IntegrityError:
+        db.rollback()
+
+    # alguna fila viola una restricción: reintentamos fila a fila
+    for row_no, values, norm in rows:
+        try:
+            with db.begin_nested():
+                db.execute(insert(model), [values])
+            state.inserted += 1
+            if norm is not None:
+                state.seen_keys.add(norm)
+        except IntegrityError as exc:
+            state.error(row_no, f"constraint violation: {exc.orig}")
+    record_changes_from(db, model, model.id > last_id)
+    db.commit()
+
+
+async def run_import(
+    request: Request,
+    db,
+    *,
+    fmt: Optional[str],
+    chunk_size: int,
+    model,
+    schema,
+    key_field: str,
+    json_fields: Tuple[str, ...] = (),
+) -> schemas.ImportReport:
+    fmt = detect_format(request, fmt)
+    chunk_size = max(1, min(chunk_size, MAX_CHUNK_SIZE))
+    records = _iter_csv(request) if fmt == "csv" else _iter_ndjson(request)
+
+    state = ImportState()
+    chunk: List[Record] = []
+
+    async def flush():
+        await run_with_session(
+            db,
+            import_chunk,
+            chunk,
+            state,
+            model=model,
+            schema=schema,
+            key_field=key_field,
+            json_fields=json_fields,
+        )
+        chunk.clear()
+
+    async for record in records:
+        state.received += 1
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            await flush()
+    if chunk:
+        await flush()
+
+    return state.report()
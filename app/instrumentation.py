@@ -0,0 +1,159 @@
+"""
+Instrumentación SQL por request.
+
+Unos listeners de SQLAlchemy cuentan las sentencias que se ejecutan durante
+cada request (nº de queries, tiempo total en BD y la query más lenta) y un
+middleware ASGI lo publica:
+
+- en la cabecera `Server-Timing` (visible en las devtools del navegador):
+      Server-Timing: db;dur=12.4;desc="7 queries", db-slowest;dur=5.1, app;dur=20.3
+- en una línea de log JSON por request en el logger `app.sql`.
+
+Las estadísticas viajan en un ContextVar, que se propaga al threadpool y a
+los greenlets de `run_sync`, así funciona en los dos modos de BD.
+"""
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+from app.config import SQL_TIMING_ROUTE_RATES, SQL_TIMING_SAMPLE_RATE
+
+logger = logging.getLogger("app.sql")
+
+MAX_LOGGED_SQL = 500
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time", "slowest_time", "slowest_sql")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql: Optional[str] = None
+
+    def record(self, statement: str, duration: float) -> None:
+        self.queries += 1
+        self.db_time += duration
+        if duration > self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_sql = statement
+
+    def server_timing(self, total: float) -> str:
+        return (
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+            f"db-slowest;dur={self.slowest_time * 1000:.1f}, "
+            f"app;dur={total * 1000:.1f}"
+        )
+
+
+_current_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "sql_request_stats", default=None
+)
+
+
+def current_stats() -> Optional[RequestStats]:
+    return _current_stats.get()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    starts = conn.info.get("query_start")
+    if stats is not None and starts:
+        stats.record(statement, time.perf_counter() - starts.pop())
+
+
+def _parse_route_rates(raw: str) -> List[Tuple[str, float]]:
+    rates = []
+    for item in raw.split(","):
+        if "=" in item:
+            prefix, rate = item.split("=", 1)
+            rates.append((prefix.strip(), float(rate)))
+    # el prefijo más largo gana
+    return sorted(rates, key=lambda r: len(r[0]), reverse=True)
+
+
+class SQLTimingMiddleware:
+    """Middleware ASGI que mide las queries de cada request muestreada."""
+
+    def __init__(
+        self,
+        app,
+        sample_rate: float = SQL_TIMING_SAMPLE_RATE,
+        route_rates: str = SQL_TIMING_ROUTE_RATES,
+    ):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.route_rates = _parse_route_rates(route_rates)
+
+    def _rate_for(self, path: str) -> float:
+        for prefix, rate in self.route_rates:
+            if path.startswith(prefix):
+                return rate
+        return self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rate = self._rate_for(scope["path"])
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        start = time.perf_counter()
+        status_code = None
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    stats.server_timing(time.perf_counter() - start),
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_stats.reset(token)
+            self._log(scope, status_code, stats, time.perf_counter() - start)
+
+    @staticmethod
+    def _log(scope, status_code, stats: RequestStats, total: float) -> None:
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        logger.info(
+            json.dumps(
+                {
+                    "event": "sql_stats",
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status_code,
+                    "queries": stats.queries,
+                    "db_ms": round(stats.db_time * 1000, 2),
+                    "total_ms": round(total * 1000, 2),
+                    "slowest_ms": round(stats.slowest_time * 1000, 2),
+                    "slowest_sql": (stats.slowest_sql or "")[:MAX_LOGGED_SQL],
+                }
+            )
+        )
@@ -1,10 +1,27 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import companies, contacts, deals, activities, dashboard
+from app import database
+from app.events import hub
+from app.instrumentation import SQLTimingMiddleware
+from app.pagination import NEXT_CURSOR_HEADER
+from app.replicas import ReadYourWritesMiddleware
+from app.routers import companies, contacts, deals, activities, dashboard, metrics, changes, events
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # reparto de eventos SSE (/events) en el loop de este worker
+    await hub.start()
+    yield
+    await hub.stop()
+
 
 app = FastAPI(
     title="CRM API",
     version="0.1.0",
+    lifespan=lifespan,
 )
 origins = [
     "http://localhost:4200",  # Angular dev
@@ -19,14 +36,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],            # GET, POST, etc.
     allow_headers=["*"],            # Authorization, Content-Type, ...
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],  # cursor de la página siguiente / versión
 )
 
+# nº de queries y tiempo en BD por request -> cabecera Server-Timing + log
+app.add_middleware(SQLTimingMiddleware)
+
+# con réplicas: después de escribir, el cliente lee del primario un rato
+if database.read_replicas or database.async_read_replicas:
+    app.add_middleware(ReadYourWritesMiddleware)
+
 
 app.include_router(companies.router)
 app.include_router(contacts.router)
 app.include_router(deals.router)
 app.include_router(activities.router)
 app.include_router(dashboard.router)
+app.include_router(metrics.router)
+app.include_router(changes.router)
+app.include_router(events.router)
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "CRM API up & running"}
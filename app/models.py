@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from sqlalchemy import (
     Column,
     BigInteger,
@@ -12,17 +14,50 @@ from sqlalchemy import (
     ForeignKey,
     JSON,
     CHAR,
+    Integer,
+    Index,
 )
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func     
 from sqlalchemy.orm import relationship
 
 from .database import Base
 
 
+# Variantes para poder levantar el esquema en SQLite (tests/local):
+# - solo INTEGER PRIMARY KEY es autoincremental en SQLite
+# - los TIMESTAMP se guardan sin microsegundos, igual que CURRENT_TIMESTAMP,
+#   para que las comparaciones de fechas (p. ej. en la paginación) cuadren
+BigIntPK = BigInteger().with_variant(Integer, "sqlite")
+Timestamp = TIMESTAMP().with_variant(
+    sqlite.DATETIME(
+        storage_format=(
+            "%(year)04d-%(month)02d-%(day)02d "
+            "%(hour)02d:%(minute)02d:%(second)02d"
+        )
+    ),
+    "sqlite",
+)
+
+
+
+def utcnow() -> datetime:
+    """
+    Default de created_at/updated_at en Python (además del server_default):
+    así el objeto ya tiene sus fechas después del flush y las respuestas de
+    escritura no necesitan releer la fila. Sin microsegundos, igual que las
+    guarda el TIMESTAMP.
+    """
+    return datetime.utcnow().replace(microsecond=0)
+
+
+DEAL_STAGES = ("prospecting", "qualified", "proposal", "won", "lost")
+
+
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    id = Column(BigIntPK, primary_key=True, index=True, autoincrement=True)
     name = Column(String(120), nullable=False)
     email = Column(String(160), nullable=False, unique=True, index=True)
     hashed_password = Column(String(255), nullable=False)
@@ -31,8 +66,8 @@ class User(Base):
         nullable=False,
         default="seller",
     )
-    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
-    last_login = Column(TIMESTAMP, nullable=True)
+    created_at = Column(Timestamp, server_default=func.current_timestamp())
+    last_login = Column(Timestamp, nullable=True)
 
     companies = relationship("Company", back_populates="owner")
     contacts = relationship("Contact", back_populates="owner")
@@ -43,7 +78,7 @@ class User(Base):
 class Company(Base):
     __tablename__ = "companies"
 
-    id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    id = Column(BigIntPK, primary_key=True, index=True, autoincrement=True)
     name = Column(String(180), nullable=False, unique=True, index=True)
     industry = Column(String(120), nullable=True)
     website = Column(String(200), nullable=True)
@@ -53,16 +88,25 @@ class Company(Base):
     address = Column(String(200), nullable=True)
     owner_user_id = Column(BigInteger, ForeignKey("users.id"), nullable=True)
     created_at = Column(
-        TIMESTAMP, server_default=func.current_timestamp(), nullable=False
+        Timestamp,
+        default=utcnow,
+        server_default=func.current_timestamp(),
+        nullable=False,
     )
     updated_at = Column(
-        TIMESTAMP,
+        Timestamp,
+        default=utcnow,
         server_default=func.current_timestamp(),
-        onupdate=func.current_timestamp(),
+        onupdate=utcnow,
         nullable=False,
     )
 
     owner = relationship("User", back_populates="companies")
+
+    __table_args__ = (
+        # listado: ORDER BY created_at DESC, id DESC (paginación por cursor)
+        Index("ix_companies_created_at_id", "created_at", "id"),
+    )
     contacts = relationship("Contact", back_populates="company")
     deals = relationship("Deal", back_populates="company")
 
@@ -70,7 +114,7 @@ class Company(Base):
 class Contact(Base):
     __tablename__ = "contacts"
 
-    id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    id = Column(BigIntPK, primary_key=True, index=True, autoincrement=True)
     first_name = Column(String(100), nullable=False)
     last_name = Column(String(100), nullable=False)
     email = Column(String(160), unique=True, nullable=True, index=True)
@@ -80,12 +124,16 @@ class Contact(Base):
     owner_user_id = Column(BigInteger, ForeignKey("users.id"), nullable=True)
     tags = Column(JSON, nullable=True)
     created_at = Column(
-        TIMESTAMP, server_default=func.current_timestamp(), nullable=False
+        Timestamp,
+        default=utcnow,
+        server_default=func.current_timestamp(),
+        nullable=False,
     )
     updated_at = Column(
-        TIMESTAMP,
+        Timestamp,
+        default=utcnow,
         server_default=func.current_timestamp(),
-        onupdate=func.current_timestamp(),
+        onupdate=utcnow,
         nullable=False,
     )
 
@@ -94,23 +142,21 @@ class Contact(Base):
     deals = relationship("Deal", back_populates="contact")
     activities = relationship("Activity", back_populates="contact")
 
+    __table_args__ = (
+        Index("ix_contacts_created_at_id", "created_at", "id"),
+        Index("ix_contacts_company_created_at", "company_id", "created_at", "id"),
+    )
+
 
 class Deal(Base):
     __tablename__ = "deals"
 
-    id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    id = Column(BigIntPK, primary_key=True, index=True, autoincrement=True)
     title = Column(String(200), nullable=False)
     amount = Column(DECIMAL(12, 2), nullable=False, default=0)
     currency = Column(CHAR(3), nullable=False, default="EUR")
     stage = Column(
-        Enum(
-            "prospecting",
-            "qualified",
-            "proposal",
-            "won",
-            "lost",
-            name="deal_stage_enum",
-        ),
+        Enum(*DEAL_STAGES, name="deal_stage_enum"),
         nullable=False,
         default="prospecting",
     )
@@ -119,12 +165,16 @@ class Deal(Base):
     contact_id = Column(BigInteger, ForeignKey("contacts.id"), nullable=True)
     owner_user_id = Column(BigInteger, ForeignKey("users.id"), nullable=True)
     created_at = Column(
-        TIMESTAMP, server_default=func.current_timestamp(), nullable=False
+        Timestamp,
+        default=utcnow,
+        server_default=func.current_timestamp(),
+        nullable=False,
     )
     updated_at = Column(
-        TIMESTAMP,
+        Timestamp,
+        default=utcnow,
         server_default=func.current_timestamp(),
-        onupdate=func.current_timestamp(),
+        onupdate=utcnow,
         nullable=False,
     )
 
@@ -133,11 +183,24 @@ class Deal(Base):
     owner = relationship("User", back_populates="deals")
     activities = relationship("Activity", back_populates="deal")
 
+    __table_args__ = (
+        # listado: cada filtro + ORDER BY created_at DESC, id DESC
+        Index("ix_deals_created_at_id", "created_at", "id"),
+        Index("ix_deals_owner_created_at", "owner_user_id", "created_at", "id"),
+        Index("ix_deals_company_created_at", "company_id", "created_at", "id"),
+        Index("ix_deals_stage_created_at", "stage", "created_at", "id"),
+        # GROUP BY del pipeline (recalcular el rollup) sin tocar la tabla
+        Index(
+            "ix_deals_owner_stage",
+            "owner_user_id", "stage", "currency", "amount",
+        ),
+    )
+
 
 class Activity(Base):
     __tablename__ = "activities"
 
-    id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    id = Column(BigIntPK, primary_key=True, index=True, autoincrement=True)
     type = Column(
         Enum("call", "email", "meeting", "task", name="activity_type_enum"),
         nullable=False,
@@ -150,9 +213,112 @@ class Activity(Base):
     contact_id = Column(BigInteger, ForeignKey("contacts.id"), nullable=True)
     owner_user_id = Column(BigInteger, ForeignKey("users.id"), nullable=True)
     created_at = Column(
-        TIMESTAMP, server_default=func.current_timestamp(), nullable=False
+        Timestamp,
+        default=utcnow,
+        server_default=func.current_timestamp(),
+        nullable=False,
+    )
+    updated_at = Column(
+        Timestamp,
+        default=utcnow,
+        server_default=func.current_timestamp(),
+        onupdate=utcnow,
+        nullable=False,
     )
 
     deal = relationship("Deal", back_populates="activities")
     contact = relationship("Contact", back_populates="activities")
     owner = relationship("User", back_populates="activities")
+
+    __table_args__ = (
+        # listado y próximas actividades: filtro + ORDER BY due_date, id
+        Index("ix_activities_due_date_id", "due_date", "id"),
+        Index("ix_activities_owner_due_date", "owner_user_id", "due_date", "id"),
+        Index("ix_activities_deal_due_date", "deal_id", "due_date", "id"),
+        Index("ix_activities_contact_due_date", "contact_id", "due_date", "id"),
+        # /activities/calendar: GROUP BY día/hora, tipo y done sin leer la tabla
+        Index(
+            "ix_activities_owner_due_type_done",
+            "owner_user_id", "due_date", "type", "done",
+        ),
+    )
+
+
+class PipelineAggregate(Base):
+    """
+    Rollup del pipeline por (comercial, etapa, moneda).
+    Lo mantienen los handlers de deals en la misma transacción que el cambio;
+    `python -m app.aggregates` lo recalcula desde cero si se desvía.
+    """
+    __tablename__ = "pipeline_aggregates"
+
+    # 0 = deals sin comercial asignado (la PK no admite NULL)
+    owner_user_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    stage = Column(Enum(*DEAL_STAGES, name="deal_stage_enum"), primary_key=True)
+    currency = Column(CHAR(3), primary_key=True)
+    deal_count = Column(BigInteger, nullable=False, default=0)
+    total_amount = Column(DECIMAL(16, 2), nullable=False, default=0)
+
+
+class PipelineSnapshot(Base):
+    """
+    Foto diaria del rollup del pipeline por (comercial, etapa, moneda).
+    La escribe `python -m app.snapshots` (una vez al día, p. ej. por cron)
+    y la lee `/dashboard/trends`.
+    """
+    __tablename__ = "pipeline_snapshots"
+
+    snapshot_date = Column(Date, primary_key=True)
+    owner_user_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    stage = Column(Enum(*DEAL_STAGES, name="deal_stage_enum"), primary_key=True)
+    currency = Column(CHAR(3), primary_key=True)
+    deal_count = Column(BigInteger, nullable=False, default=0)
+    total_amount = Column(DECIMAL(16, 2), nullable=False, default=0)
+    # total_amount ponderado con la probabilidad de la etapa
+    expected_amount = Column(DECIMAL(16, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        # tendencias de un comercial: filtro + rango de fechas
+        Index("ix_pipeline_snapshots_owner_date", "owner_user_id", "snapshot_date"),
+    )
+
+
+CHANGE_ENTITIES = ("company", "contact", "deal", "activity")
+
+
+class ChangeLog(Base):
+    """
+    Registro de altas, cambios y bajas de compañías, contactos, deals y
+    actividades para `GET /changes`. Se escribe en la misma transacción que
+    el cambio (ver app/changes.py); el `id` es el token del feed.
+    """
+    __tablename__ = "change_log"
+
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
+    entity = Column(Enum(*CHANGE_ENTITIES, name="change_entity_enum"), nullable=False)
+    entity_id = Column(BigInteger, nullable=False)
+    # "upsert" (alta o cambio) o "delete" (tombstone)
+    op = Column(Enum("upsert", "delete", name="change_op_enum"), nullable=False)
+    changed_at = Column(
+        Timestamp,
+        default=utcnow,
+        server_default=func.current_timestamp(),
+        nullable=False,
+    )
+
+
+class ChangeLogPrune(Base):
+    """
+    Cada limpieza del `change_log`: hasta qué id se borró. Un token menor
+    que el último `pruned_through` ha perdido cambios (410 en `GET /changes`).
+    """
+    __tablename__ = "change_log_prunes"
+
+    id = Column(BigIntPK, primary_key=True, autoincrement=True)
+    pruned_through = Column(BigInteger, nullable=False)
+    pruned_at = Column(
+        Timestamp,
+        default=utcnow,
+        server_default=func.current_timestamp(),
+        nullable=False,
+    )
@@ -0,0 +1,73 @@
+"""
+Nombres de compañías y contactos para las respuestas de escritura.
+
+Un deal se devuelve con `company_name` y `contact_name`. En vez de releer el
+deal con sus joins después del commit, los handlers construyen la respuesta
+desde el objeto ya escrito y piden aquí los nombres: salen de `name_cache`
+(etiquetado `company:<id>` / `contact:<id>`, así que los renombres de este
+proceso lo invalidan al momento) y, si falta alguno, de una sola query con
+los dos. El TTL acota lo que tarda en verse un renombre hecho en otro worker.
+"""
+from typing import Optional, Tuple
+
+from sqlalchemy import literal, select
+
+from app import models
+from app.cache import name_cache, tag
+
+_MISSING = object()
+
+
+def _cached(kind: str, entity_id: Optional[int]):
+    if entity_id is None:
+        return None
+    if not name_cache.enabled:
+        return _MISSING
+    hit, name = name_cache.get((kind, entity_id))
+    return name if hit else _MISSING
+
+
+def related_names(
+    db,
+    company_id: Optional[int],
+    contact_id: Optional[int],
+) -> Tuple[Optional[str], Optional[str]]:
+    """(nombre de la compañía, "nombre apellido" del contacto); None si no hay."""
+    company_name = _cached("company", company_id)
+    contact_name = _cached("contact", contact_id)
+    if company_name is not _MISSING and contact_name is not _MISSING:
+        return company_name, contact_name
+
+    Company, Contact = models.Company, models.Contact
+    generation = name_cache.generation
+    company_q = contact_first = contact_last = literal(None)
+    if company_name is _MISSING:
+        company_q = (
+            select(Company.name).where(Company.id == company_id).scalar_subquery()
+        )
+    if contact_name is _MISSING:
+        contact_first = (
+            select(Contact.first_name).where(Contact.id == contact_id).scalar_subquery()
+        )
+        contact_last = (
+            select(Contact.last_name).where(Contact.id == contact_id).scalar_subquery()
+        )
+    fetched_company, first_name, last_name = db.execute(
+        select(company_q, contact_first, contact_last)
+    ).one()
+
+    if company_name is _MISSING:
+        company_name = fetched_company
+        if company_name is not None:
+            name_cache.set(
+                ("company", company_id), company_name,
+                [tag("company", company_id)], generation,
+            )
+    if contact_name is _MISSING:
+        contact_name = f"{first_name} {last_name}" if first_name is not None else None
+        if contact_name is not None:
+            name_cache.set(
+                ("contact", contact_id), contact_name,
+                [tag("contact", contact_id)], generation,
+            )
+    return company_name, contact_name
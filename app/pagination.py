@@ -0,0 +1,147 @@
+"""
+Paginación por cursor (keyset) para los endpoints de listado.
+
+El cursor es opaco para el cliente: codifica en base64 el valor de la
+columna de orden de la última fila devuelta más su `id` (desempate).
+La página siguiente se pide con `WHERE (orden, id) > (valor, id)` en lugar
+de `OFFSET`, así MySQL no recorre ni descarta las filas anteriores y cada
+página cuesta lo mismo sea cual sea su profundidad.
+"""
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, or_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# tope de filas por página de los listados
+MAX_PAGE_LIMIT = 500
+
+
+def _dump(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    return value
+
+
+def _load(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "dec" in value:
+            return Decimal(value["dec"])
+    return value
+
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    payload = json.dumps([_dump(sort_value), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return _load(sort_value), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+
+def _after(sort_col, id_col, sort_value, row_id, descending: bool):
+    """
+    Condición "fila posterior al cursor" para ORDER BY sort_col, id_col.
+    Los NULL se consideran menores que cualquier valor (como hacen MySQL y
+    SQLite), es decir, van primero en ASC y al final en DESC.
+    """
+    if descending:
+        if sort_value is None:
+            return and_(sort_col.is_(None), id_col < row_id)
+        return or_(
+            sort_col < sort_value,
+            and_(sort_col == sort_value, id_col < row_id),
+            sort_col.is_(None),
+        )
+
+    if sort_value is None:
+        return or_(
+            and_(sort_col.is_(None), id_col > row_id),
+            sort_col.isnot(None),
+        )
+    return or_(
+        sort_col > sort_value,
+        and_(sort_col == sort_value, id_col > row_id),
+    )
+
+
+def keyset_paginate(
+    query,
+    sort_col,
+    id_col,
+    *,
+    cursor: Optional[str],
+    skip: int,
+    limit: int,
+    response: Response,
+    descending: bool = False,
+    key: Optional[Callable[[Any], Tuple[Any, int]]] = None,
+) -> List[Any]:
+    """
+    Aplica orden + paginación a `query` y devuelve las filas de la página.
+
+    - Con `cursor` se pagina por keyset y se ignora `skip`.
+    - Sin `cursor` se mantiene `skip` (OFFSET) para clientes antiguos.
+    Si hay más filas, el cursor de la siguiente página va en la cabecera
+    `X-Next-Cursor`. `key` extrae (valor_orden, id) de cada fila; por
+    defecto se leen los atributos de `sort_col` e `id_col`. `limit` se
+    acota a 1..MAX_PAGE_LIMIT.
+    """
+    limit = max(1, min(limit, MAX_PAGE_LIMIT))
+    if key is None:
+        sort_attr, id_attr = sort_col.key, id_col.key
+
+        def key(row):
+            return getattr(row, sort_attr), getattr(row, id_attr)
+
+    if descending:
+        query = query.order_by(sort_col.desc(), id_col.desc())
+    else:
+        query = query.order_by(sort_col.asc(), id_col.asc())
+
+    if cursor:
+        query = query.filter(_after(sort_col, id_col, *decode_cursor(cursor), descending))
+    elif skip > 0:
+        query = query.offset(skip)
+
+    # pedimos una fila de más para saber si existe página siguiente
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
+    return rows
+
+
+# tope de filas por página de las colecciones de las vistas de detalle
+MAX_COLLECTION_LIMIT = 200
+
+
+def collection_page(query, order_by, skip: int, limit: int) -> List[Any]:
+    """
+    Página de una colección de una vista de detalle (contactos/deals de una
+    compañía, ...): OFFSET/LIMIT con `limit` acotado a MAX_COLLECTION_LIMIT.
+    El total ya lo trae la query de versión del detalle.
+    """
+    limit = max(1, min(limit, MAX_COLLECTION_LIMIT))
+    return query.order_by(*order_by).offset(max(skip, 0)).limit(limit).all()
@@ -0,0 +1,136 @@
+"""
+Pool de conexiones instrumentado.
+
+`InstrumentedQueuePool` (y su versión async) es un `QueuePool` que mide
+cuánto espera cada request para obtener una conexión y cuenta los
+timeouts y las conexiones nuevas que abre. `pool_metrics` junta esas
+cifras con el estado actual del pool (conexiones en uso, overflow, ...)
+para el endpoint `/metrics/pool`.
+"""
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.config import DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT
+
+
+class PoolStats:
+    """Contadores acumulados de un pool (desde que arrancó el proceso)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.connects = 0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.acquisitions += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_connect(self) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def record_timeout(self, seconds: float) -> None:
+        with self._lock:
+            self.timeouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            waits = self.acquisitions + self.timeouts
+            return {
+                "acquisitions": self.acquisitions,
+                "timeouts": self.timeouts,
+                "wait_ms_total": round(self.wait_total * 1000, 3),
+                "wait_ms_avg": round(self.wait_total * 1000 / waits, 3) if waits else 0.0,
+                "wait_ms_max": round(self.wait_max * 1000, 3),
+                "connects": self.connects,
+            }
+
+
+class _InstrumentedMixin:
+    stats: PoolStats
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _create_connection(self):
+        self.stats.record_connect()
+        return super()._create_connection()
+
+    def _do_get(self):
+        # incluye la espera en la cola y, si hace falta, abrir la conexión
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_timeout(time.perf_counter() - start)
+            raise
+        self.stats.record_wait(time.perf_counter() - start)
+        return conn
+
+    def recreate(self):
+        # engine.dispose() crea un pool nuevo: conservamos los contadores
+        new_pool = super().recreate()
+        new_pool.stats = self.stats
+        return new_pool
+
+
+class InstrumentedQueuePool(_InstrumentedMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options(url: str, *, is_async: bool = False) -> dict:
+    """kwargs de `create_engine` para el pool, según la configuración."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # SQLite en memoria: una sola conexión por hilo, sin cola
+        return {}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+
+def pool_metrics(engine) -> Optional[dict]:
+    """Estado actual + contadores del pool de `engine` (None si no hay motor)."""
+    if engine is None:
+        return None
+    engine = getattr(engine, "sync_engine", engine)
+    pool = engine.pool
+    metrics = {
+        "url": engine.url.render_as_string(hide_password=True),
+        "pool": pool.__class__.__name__,
+    }
+    if isinstance(pool, QueuePool):
+        metrics.update(
+            size=pool.size(),
+            max_overflow=pool._max_overflow,
+            timeout=pool.timeout(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            # negativo mientras no se hayan abierto todas las conexiones base
+            overflow=pool.overflow(),
+        )
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        metrics.update(stats.snapshot())
+    return metrics
@@ -0,0 +1,129 @@
+"""
+Réplicas de lectura.
+
+Con `CRM_DATABASE_REPLICA_URLS` los endpoints GET abren la sesión con
+`get_read_session` (ver app/database.py), que elige una réplica:
+
+- `round_robin`: una detrás de otra;
+- `least_connections`: la que tenga menos conexiones en uso en su pool
+  (los empates se reparten en round robin).
+
+Las réplicas van con retraso respecto al primario, así que un cliente que
+acaba de escribir leería su propio cambio a medias. `ReadYourWritesMiddleware`
+pone una cookie después de cada escritura que ha ido bien y, mientras no
+caduque (`CRM_READ_YOUR_WRITES_SECONDS`), las lecturas de ese cliente van
+al primario.
+
+Sin réplicas configuradas todo sigue yendo al primario y no se pone cookie.
+"""
+import itertools
+import math
+import time
+from contextvars import ContextVar
+from typing import List, NamedTuple, Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+from app.config import READ_YOUR_WRITES_SECONDS
+
+READ_PRIMARY_COOKIE = "crm_read_primary_until"
+
+ROUND_ROBIN = "round_robin"
+LEAST_CONNECTIONS = "least_connections"
+
+_SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# True mientras se atiende una request que debe leer del primario
+_prefer_primary: ContextVar[bool] = ContextVar("read_prefer_primary", default=False)
+
+
+def prefer_primary() -> bool:
+    return _prefer_primary.get()
+
+
+class Replica(NamedTuple):
+    engine: object
+    sessionmaker: object
+
+
+def _checked_out(engine) -> int:
+    pool = getattr(engine, "sync_engine", engine).pool
+    # SingletonThreadPool/StaticPool (SQLite en memoria) no llevan la cuenta
+    return pool.checkedout() if hasattr(pool, "checkedout") else 0
+
+
+class ReplicaSet:
+    """Réplicas de un modo (sync o async) y la estrategia para elegir una."""
+
+    def __init__(self, replicas: List[Replica], strategy: str = ROUND_ROBIN):
+        if strategy not in (ROUND_ROBIN, LEAST_CONNECTIONS):
+            raise ValueError(
+                f"Invalid replica strategy {strategy!r} "
+                f"(use {ROUND_ROBIN} or {LEAST_CONNECTIONS})"
+            )
+        self.replicas = replicas
+        self.strategy = strategy
+        self._counter = itertools.count()
+
+    def __bool__(self) -> bool:
+        return bool(self.replicas)
+
+    @property
+    def engines(self) -> List[object]:
+        return [r.engine for r in self.replicas]
+
+    def choose(self) -> Optional[object]:
+        """sessionmaker de la réplica elegida (None si no hay réplicas)."""
+        if not self.replicas:
+            return None
+        start = next(self._counter) % len(self.replicas)
+        if self.strategy == ROUND_ROBIN:
+            return self.replicas[start].sessionmaker
+        order = self.replicas[start:] + self.replicas[:start]
+        return min(order, key=lambda r: _checked_out(r.engine)).sessionmaker
+
+
+class ReadYourWritesMiddleware:
+    """
+    Middleware ASGI: marca las lecturas que deben ir al primario y pone la
+    cookie de read-your-writes en las escrituras que han ido bien.
+    """
+
+    def __init__(self, app, window: float = READ_YOUR_WRITES_SECONDS):
+        self.app = app
+        self.window = window
+
+    def _recent_write(self, scope) -> bool:
+        value = HTTPConnection(scope).cookies.get(READ_PRIMARY_COOKIE)
+        try:
+            return value is not None and float(value) > time.time()
+        except ValueError:
+            return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.window <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        is_write = scope["method"] not in _SAFE_METHODS
+
+        async def send_with_cookie(message):
+            if (
+                is_write
+                and message["type"] == "http.response.start"
+                and message["status"] < 400
+            ):
+                until = time.time() + self.window
+                MutableHeaders(scope=message).append(
+                    "Set-Cookie",
+                    f"{READ_PRIMARY_COOKIE}={until:.3f}; "
+                    f"Max-Age={math.ceil(self.window)}; Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        token = _prefer_primary.set(is_write or self._recent_write(scope))
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            _prefer_primary.reset(token)
@@ -0,0 +1,80 @@
+"""
+Camino rápido de serialización para los listados.
+
+Antes cada listado construía un `DealOut(...)`/`ActivityOut(...)` por fila y
+después FastAPI volvía a validar y serializar todo contra el
+`response_model`: en una página de 500 filas ese doble trabajo era la mayor
+parte del tiempo de CPU. Ahora los listados pasan las filas ORM a dicts
+(los mismos campos que el schema, en el mismo orden) y devuelven una
+`FastJSONResponse` ya serializada, que FastAPI envía tal cual.
+
+Se usa orjson si está instalado y, si no, `json` de la librería estándar.
+El `response_model` de la ruta se mantiene para la documentación OpenAPI.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+# campo de salida -> función que lo calcula desde la fila ORM
+Enriched = Dict[str, Callable[[object], object]]
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def row_dicts(rows: Iterable, fields: Sequence[str], enriched: Enriched) -> List[dict]:
+    """Filas ORM -> dicts con `fields`; `enriched` calcula los que no son columnas."""
+    getters = [
+        (f, enriched[f]) if f in enriched else (f, None)
+        for f in fields
+    ]
+    return [
+        {f: get(row) if get else getattr(row, f) for f, get in getters}
+        for row in rows
+    ]
+
+
+def list_response(
+    rows: Iterable,
+    fields: Sequence[str],
+    enriched: Enriched,
+    response: Optional[Response] = None,
+) -> FastJSONResponse:
+    """
+    Respuesta ya serializada de un listado, conservando las cabeceras que
+    el handler haya puesto en `response` (p. ej. X-Next-Cursor).
+    """
+    out = FastJSONResponse(row_dicts(rows, fields, enriched))
+    if response is not None:
+        for key, value in response.headers.items():
+            if key != "content-length":
+                out.headers[key] = value
+    return out
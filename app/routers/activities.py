@@ -1,11 +1,17 @@
 from typing import List, Optional
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import or_  
-from app import models, schemas
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.orm import Session, aliased, contains_eager
+from sqlalchemy import func, or_
+from app import export, models, schemas
+from app.batch import fetch_batch, parse_ids
+from app.cache import invalidate, tag
+from app.database import async_endpoint, flush_or_400, get_read_session, get_session
+from app.events import hub
+from app.fields import model_columns, parse_fields
+from app.pagination import keyset_paginate
+from app.responses import list_response
 
 router = APIRouter(
     prefix="/activities",
@@ -14,6 +20,7 @@ router = APIRouter(
 
 
 @router.get("/", response_model=List[schemas.ActivityOut])
+@async_endpoint
 def list_activities(
     due_from: Optional[datetime] = None,
     due_to: Optional[datetime] = None,
@@ -22,14 +29,14 @@ def list_activities(
     type: Optional[str] = None,
     skip: int = 0,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    response: Response = None,
+    db: Session = Depends(get_read_session),
 ):
-    query = (
-        db.query(models.Activity)
-        .outerjoin(models.Contact)
-        .outerjoin(models.Deal)
-        .outerjoin(models.Company)
-    )
+    selected = parse_fields(fields, schemas.ActivityOut)
+    out_fields = selected or ACTIVITY_FIELDS
+    query = _list_query(db, out_fields)
 
     if deal_id:
         query = query.filter(models.Activity.deal_id == deal_id)
@@ -42,48 +49,207 @@ def list_activities(
     if type:
         query = query.filter(models.Activity.type == type)
 
-    results = (
-        query
-        .order_by(models.Activity.due_date.asc())
-        .offset(skip)
-        .limit(limit)
-        .all()
+    results = keyset_paginate(
+        query,
+        models.Activity.due_date,
+        models.Activity.id,
+        cursor=cursor,
+        skip=skip,
+        limit=limit,
+        response=response,
     )
 
-    # Enriquecer resultados
-    enriched = []
-    for a in results:
-        contact_name = (
-            f"{a.contact.first_name} {a.contact.last_name}"
-            if a.contact else None
+    return list_response(results, out_fields, ACTIVITY_ENRICHED, response)
+
+
+def enriched_query(db: Session):
+    """
+    Actividades con contact/deal/deal.company cargados en la misma query
+    (contains_eager): sin esto cada fila dispararía sus propios SELECT perezosos.
+    """
+    return (
+        db.query(models.Activity)
+        .outerjoin(models.Activity.contact)
+        .outerjoin(models.Activity.deal)
+        .outerjoin(models.Deal.company)
+        .options(
+            contains_eager(models.Activity.contact),
+            contains_eager(models.Activity.deal).contains_eager(models.Deal.company),
         )
-        deal_title = a.deal.title if a.deal else None
-        company_name = a.deal.company.name if a.deal and a.deal.company else None
-
-        enriched.append(
-            schemas.ActivityOut(
-                id=a.id,
-                type=a.type,
-                subject=a.subject,
-                notes=a.notes,
-                due_date=a.due_date,
-                done=a.done,
-                deal_id=a.deal_id,
-                contact_id=a.contact_id,
-                owner_user_id=a.owner_user_id,
-                created_at=a.created_at,
-                contact_name=contact_name,
-                deal_title=deal_title,
-                company_name=company_name,
-            )
+    )
+
+
+def _list_query(db: Session, out_fields):
+    """
+    Filas planas (sin objetos ORM) con solo las columnas de `out_fields`
+    (+ la del cursor) y solo los joins de los nombres pedidos.
+    """
+    Activity, Deal, Contact = models.Activity, models.Deal, models.Contact
+    DealCompany = aliased(models.Company)
+    query = db.query(*model_columns(Activity, out_fields, Activity.due_date))
+    if "contact_name" in out_fields:
+        query = query.add_columns(
+            Contact.first_name.label("contact_first_name"),
+            Contact.last_name.label("contact_last_name"),
+        ).outerjoin(Contact, Activity.contact_id == Contact.id)
+    if "deal_title" in out_fields or "company_name" in out_fields:
+        query = query.outerjoin(Deal, Activity.deal_id == Deal.id)
+        if "deal_title" in out_fields:
+            query = query.add_columns(Deal.title.label("deal_title"))
+        if "company_name" in out_fields:
+            query = query.add_columns(
+                DealCompany.name.label("company_name")
+            ).outerjoin(DealCompany, Deal.company_id == DealCompany.id)
+    return query
+
+
+ACTIVITY_FIELDS = tuple(schemas.ActivityOut.model_fields)
+
+# campos de ActivityOut que se calculan desde las filas de `_list_query`
+ACTIVITY_ENRICHED = {
+    "contact_name": lambda row: (
+        f"{row.contact_first_name} {row.contact_last_name}"
+        if row.contact_first_name is not None
+        else None
+    ),
+}
+
+
+def activity_to_out(a: models.Activity) -> schemas.ActivityOut:
+    """ActivityOut enriquecido; usar con `enriched_query`."""
+    contact_name = (
+        f"{a.contact.first_name} {a.contact.last_name}"
+        if a.contact else None
+    )
+    deal_title = a.deal.title if a.deal else None
+    company_name = a.deal.company.name if a.deal and a.deal.company else None
+
+    return schemas.ActivityOut(
+        id=a.id,
+        type=a.type,
+        subject=a.subject,
+        notes=a.notes,
+        due_date=a.due_date,
+        done=a.done,
+        deal_id=a.deal_id,
+        contact_id=a.contact_id,
+        owner_user_id=a.owner_user_id,
+        created_at=a.created_at,
+        updated_at=a.updated_at,
+        contact_name=contact_name,
+        deal_title=deal_title,
+        company_name=company_name,
+    )
+
+
+@router.get("/export")
+async def export_activities(
+    format: str = "csv",
+    due_from: Optional[datetime] = None,
+    due_to: Optional[datetime] = None,
+    owner_user_id: Optional[int] = None,
+    deal_id: Optional[int] = None,
+):
+    """Exporta todas las actividades (con contacto, deal y compañía) en stream."""
+    return export.export_response(
+        export.activities_statement(due_from, due_to, owner_user_id, deal_id),
+        export.activity_row,
+        export.ACTIVITY_FIELDS,
+        format,
+        "activities",
+    )
+
+
+# rango máximo por granularidad (acota el nº de buckets de la respuesta)
+CALENDAR_MAX_DAYS = {"day": 366, "hour": 62}
+
+
+def _due_bucket(dialect: str, granularity: str):
+    """Expresión del bucket de `due_date` (día u hora) para cada dialecto."""
+    due = models.Activity.due_date
+    if granularity == "day":
+        return func.date(due)
+    if dialect == "mysql":
+        return func.date_format(due, "%Y-%m-%d %H:00:00")
+    return func.strftime("%Y-%m-%d %H:00:00", due)
+
+
+@router.get("/calendar", response_model=schemas.ActivityCalendar)
+@async_endpoint
+def get_activity_calendar(
+    due_from: datetime,
+    due_to: datetime,
+    owner_user_id: Optional[int] = None,
+    granularity: str = "day",
+    db: Session = Depends(get_read_session),
+):
+    """
+    Nº de actividades por día (u hora), tipo y done en [due_from, due_to],
+    para la vista de calendario: un solo GROUP BY, sin devolver actividades.
+    Los buckets son de la hora guardada en due_date (UTC).
+    """
+    if granularity not in CALENDAR_MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid granularity (use day or hour)",
+        )
+    if due_from > due_to:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="due_from must be before due_to",
         )
+    max_days = CALENDAR_MAX_DAYS[granularity]
+    if (due_to - due_from).days > max_days:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range too large (max {max_days} days with granularity={granularity})",
+        )
+
+    Activity = models.Activity
+    bucket = _due_bucket(db.get_bind().dialect.name, granularity).label("bucket")
+    query = db.query(
+        bucket,
+        Activity.type,
+        Activity.done,
+        func.count().label("count"),
+    ).filter(Activity.due_date >= due_from, Activity.due_date <= due_to)
+    if owner_user_id:
+        query = query.filter(Activity.owner_user_id == owner_user_id)
+
+    rows = query.group_by(bucket, Activity.type, Activity.done).order_by(bucket).all()
+
+    buckets = [
+        schemas.ActivityCalendarBucket(
+            # DATE (MySQL) o texto (SQLite) -> "YYYY-MM-DD[THH:00:00]"
+            bucket=str(row.bucket).replace(" ", "T"),
+            type=row.type,
+            done=bool(row.done),
+            count=row.count,
+        )
+        for row in rows
+    ]
+    return schemas.ActivityCalendar(
+        granularity=granularity,
+        due_from=due_from,
+        due_to=due_to,
+        total=sum(b.count for b in buckets),
+        buckets=buckets,
+    )
 
-    return enriched
 
+@router.get("/batch", response_model=schemas.ActivityBatch)
+@async_endpoint
+def get_activities_batch(ids: str, db: Session = Depends(get_read_session)):
+    """Varias actividades por id (`?ids=3,1,2`) en una query, en el orden pedido."""
+    items, missing = fetch_batch(
+        enriched_query(db), models.Activity.id, parse_ids(ids), activity_to_out
+    )
+    return {"items": items, "missing": missing}
 
 
 @router.get("/{activity_id}", response_model=schemas.ActivityOut)
-def get_activity(activity_id: int, db: Session = Depends(get_db)):
+@async_endpoint
+def get_activity(activity_id: int, db: Session = Depends(get_read_session)):
     activity = (
         db.query(models.Activity)
         .filter(models.Activity.id == activity_id)
@@ -97,10 +263,20 @@ def get_activity(activity_id: int, db: Session = Depends(get_db)):
     return activity
 
 
+def _cache_tags(activity: models.Activity):
+    """
+    Entradas de caché que muestran esta actividad. Para no consultar a qué
+    compañía pertenece (vía deal o contacto) se invalidan todos los detalles
+    de compañía.
+    """
+    return ("dashboard", "companies", tag("contact", activity.contact_id))
+
+
 @router.post("/", response_model=schemas.ActivityOut, status_code=status.HTTP_201_CREATED)
+@async_endpoint
 def create_activity(
     activity_in: schemas.ActivityCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
 ):
     if activity_in.type not in ["call", "email", "meeting", "task"]:
         raise HTTPException(
@@ -110,16 +286,21 @@ def create_activity(
 
     activity = models.Activity(**activity_in.dict())
     db.add(activity)
+    flush_or_400(db)
+    out = schemas.ActivityOut.model_validate(activity, from_attributes=True)
+    tags = _cache_tags(activity)
     db.commit()
-    db.refresh(activity)
-    return activity
+    invalidate(*tags)
+    hub.publish("activity.created", out, [out.owner_user_id])
+    return out
 
 
 @router.patch("/{activity_id}", response_model=schemas.ActivityOut)
+@async_endpoint
 def update_activity(
     activity_id: int,
     activity_in: schemas.ActivityUpdate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
 ):
     activity = (
         db.query(models.Activity)
@@ -139,16 +320,23 @@ def update_activity(
             detail="Invalid activity type",
         )
 
+    stale_tags = _cache_tags(activity)
+    previous_owner = activity.owner_user_id
     for field, value in data.items():
         setattr(activity, field, value)
 
+    flush_or_400(db)
+    out = schemas.ActivityOut.model_validate(activity, from_attributes=True)
+    tags = _cache_tags(activity)
     db.commit()
-    db.refresh(activity)
-    return activity
+    invalidate(*stale_tags, *tags)
+    hub.publish("activity.updated", out, [previous_owner, out.owner_user_id])
+    return out
 
 
 @router.delete("/{activity_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_activity(activity_id: int, db: Session = Depends(get_db)):
+@async_endpoint
+def delete_activity(activity_id: int, db: Session = Depends(get_session)):
     activity = (
         db.query(models.Activity)
         .filter(models.Activity.id == activity_id)
@@ -160,6 +348,10 @@ def delete_activity(activity_id: int, db: Session = Depends(get_db)):
             detail="Activity not found",
         )
 
+    stale_tags = _cache_tags(activity)
+    owner_user_id = activity.owner_user_id
     db.delete(activity)
     db.commit()
+    invalidate(*stale_tags)
+    hub.publish("activity.deleted", {"id": activity_id}, [owner_user_id])
     return None
@@ -0,0 +1,86 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.batch import fetch_batch
+from app.changes import (
+    DELETE,
+    UPSERT,
+    current_token,
+    ids_by_entity,
+    read_changes,
+    token_expired,
+)
+from app.database import async_endpoint, get_session
+from app.routers import activities, deals
+
+router = APIRouter(
+    prefix="/changes",
+    tags=["changes"],
+)
+
+DEFAULT_CHANGES_LIMIT = 500
+MAX_CHANGES_LIMIT = 1000
+
+
+@router.get("", response_model=schemas.ChangeFeed)
+@async_endpoint
+def get_changes(
+    since: Optional[int] = None,
+    limit: int = DEFAULT_CHANGES_LIMIT,
+    # del primario: en una réplica con retraso el token pasaría por encima
+    # de entradas del log que aún no le han llegado, y no se mandarían nunca
+    db: Session = Depends(get_session),
+):
+    """
+    Compañías, contactos, deals y actividades creados, modificados o borrados
+    desde el token `since` (ver app/changes.py).
+    - sin `since`: solo devuelve el token actual; el cliente lo pide antes
+      de la carga inicial y a partir de ahí sondea con él
+    - cada entidad sale una vez, en su estado actual, o en `deleted`
+    - `has_more`: quedan cambios, volver a llamar con `next_token` enseguida
+    - 410: el token es anterior a la limpieza del log; recargar entero
+    """
+    if since is None:
+        return {"next_token": current_token(db), "has_more": False}
+    limit = max(1, min(limit, MAX_CHANGES_LIMIT))
+
+    if token_expired(db, since):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Change token expired, reload the data",
+        )
+
+    changes, next_token, has_more = read_changes(db, since, limit)
+    upserted = ids_by_entity(changes, UPSERT)
+    deleted = ids_by_entity(changes, DELETE)
+
+    # lo que ya no existe (borrado después, en una entrada posterior) va a deleted
+    def fetch(entity, query, id_column, to_out=lambda row: row):
+        items, missing = fetch_batch(query, id_column, upserted[entity], to_out)
+        deleted[entity].extend(missing)
+        return items
+
+    return {
+        "next_token": next_token,
+        "has_more": has_more,
+        "companies": fetch("company", db.query(models.Company), models.Company.id),
+        "contacts": fetch("contact", db.query(models.Contact), models.Contact.id),
+        "deals": fetch(
+            "deal", deals._enriched_query(db), models.Deal.id, deals.deal_to_out
+        ),
+        "activities": fetch(
+            "activity",
+            activities.enriched_query(db),
+            models.Activity.id,
+            activities.activity_to_out,
+        ),
+        "deleted": {
+            "companies": deleted["company"],
+            "contacts": deleted["contact"],
+            "deals": deleted["deal"],
+            "activities": deleted["activity"],
+        },
+    }
@@ -1,29 +1,46 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.orm import Session, contains_eager
+from sqlalchemy import func, or_, select
 from app import models, schemas
-from app.database import get_db
+from app.batch import fetch_batch, parse_ids
+from app.cache import cached_response, invalidate, tag
+from app.database import async_endpoint, flush_or_400, get_read_session, get_session
+from app.etag import respond_if_unchanged, set_etag, wants_revalidation, weak_etag
+from app.fields import load_columns, parse_fields
+from app.importer import DEFAULT_CHUNK_SIZE, run_import
+from app.pagination import collection_page, keyset_paginate
+from app.responses import list_response
+from app.search import search_page
+from app.upsert import upsert_by_key
 
 router = APIRouter(
     prefix="/companies",
     tags=["companies"],
 )
 
+COMPANY_FIELDS = tuple(schemas.CompanyOut.model_fields)
+
+
 @router.get("/", response_model=List[schemas.CompanyOut])
+@async_endpoint
 def list_companies(
     search: Optional[str] = None,
     city: Optional[str] = None,
     industry: Optional[str] = None,
     skip: int = 0,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    response: Response = None,
+    db: Session = Depends(get_read_session),
 ):
     query = db.query(models.Company)
-
-    if search:
-        like = f"%{search}%"
-        query = query.filter(models.Company.name.ilike(like))
+    selected = parse_fields(fields, schemas.CompanyOut)
+    if selected is not None:
+        query = query.options(
+            load_columns(models.Company, selected, models.Company.created_at)
+        )
 
     if city:
         query = query.filter(models.Company.city.ilike(f"%{city}%"))
@@ -31,54 +48,135 @@ def list_companies(
     if industry:
         query = query.filter(models.Company.industry.ilike(f"%{industry}%"))
 
-    return (
-        query
-        .order_by(models.Company.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
+    if search:
+        # busca en nombre, ciudad e industria; resultados por relevancia
+        companies = search_page(
+            query,
+            models.Company,
+            search,
+            cursor=cursor,
+            skip=skip,
+            limit=limit,
+            response=response,
+        )
+    else:
+        companies = keyset_paginate(
+            query,
+            models.Company.created_at,
+            models.Company.id,
+            cursor=cursor,
+            skip=skip,
+            limit=limit,
+            response=response,
+            descending=True,
+        )
+
+    return list_response(companies, selected or COMPANY_FIELDS, {}, response)
+
+@router.post("/import", response_model=schemas.ImportReport)
+async def import_companies(
+    request: Request,
+    format: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    db: Session = Depends(get_session),
+):
+    """
+    Importa compañías desde un body CSV (con cabecera) o NDJSON en stream.
+    Deduplica por nombre contra la tabla y dentro del propio fichero.
+    """
+    return await run_import(
+        request,
+        db,
+        fmt=format,
+        chunk_size=chunk_size,
+        model=models.Company,
+        schema=schemas.CompanyCreate,
+        key_field="name",
+    )
+
+@router.put("/upsert", response_model=schemas.UpsertReport)
+@async_endpoint
+def upsert_companies(
+    items: List[schemas.CompanyCreate],
+    db: Session = Depends(get_session),
+):
+    """
+    Crea o actualiza compañías por `name` (sincronización con el ERP).
+    Devuelve cuántas se han insertado, actualizado o no cambiaban.
+    """
+    report, tags = upsert_by_key(
+        db,
+        models.Company,
+        "name",
+        items,
+        lambda existing, values: [tag("company", existing.id)] if existing else [],
     )
+    invalidate(*tags)
+    return report
+
+
+@router.get("/batch", response_model=schemas.CompanyBatch)
+@async_endpoint
+def get_companies_batch(ids: str, db: Session = Depends(get_read_session)):
+    """Varias compañías por id (`?ids=3,1,2`) en una query, en el orden pedido."""
+    items, missing = fetch_batch(
+        db.query(models.Company), models.Company.id, parse_ids(ids)
+    )
+    return {"items": items, "missing": missing}
 
 @router.get("/{company_id}", response_model=schemas.CompanyOut)
-def get_company(company_id: int, db: Session = Depends(get_db)):
+@async_endpoint
+def get_company(
+    company_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_session),
+):
+    if wants_revalidation(request):
+        # solo leemos updated_at para decidir si basta con un 304
+        updated_at = (
+            db.query(models.Company.updated_at)
+            .filter(models.Company.id == company_id)
+            .scalar()
+        )
+        if updated_at is not None:
+            unchanged = respond_if_unchanged(
+                request, response, weak_etag("company", company_id, updated_at)
+            )
+            if unchanged is not None:
+                return unchanged
+
     company = db.query(models.Company).filter(models.Company.id == company_id).first()
     if not company:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Company not found",
         )
+    set_etag(response, weak_etag("company", company.id, company.updated_at))
     return company
 
 
 @router.post("/", response_model=schemas.CompanyOut, status_code=status.HTTP_201_CREATED)
+@async_endpoint
 def create_company(
     company_in: schemas.CompanyCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
 ):
-    # Comprobar si el nombre ya existe
-    existing = (
-        db.query(models.Company)
-        .filter(models.Company.name == company_in.name)
-        .first()
-    )
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Company with this name already exists",
-        )
-
     company = models.Company(**company_in.dict())
     db.add(company)
+    # el nombre repetido lo detecta el índice único (-> 400)
+    flush_or_400(db, "Company with this name already exists")
+    out = schemas.CompanyOut.model_validate(company, from_attributes=True)
     db.commit()
-    db.refresh(company)
-    return company
+    return out
 
 
 @router.patch("/{company_id}", response_model=schemas.CompanyOut)
+@async_endpoint
 def update_company(
     company_id: int,
     company_in: schemas.CompanyUpdate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
 ):
     company = db.query(models.Company).filter(models.Company.id == company_id).first()
     if not company:
@@ -91,13 +189,16 @@ def update_company(
     for field, value in data.items():
         setattr(company, field, value)
 
+    flush_or_400(db, "Company with this name already exists")
+    out = schemas.CompanyOut.model_validate(company, from_attributes=True)
     db.commit()
-    db.refresh(company)
-    return company
+    invalidate(tag("company", company_id))
+    return out
 
 
 @router.delete("/{company_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_company(company_id: int, db: Session = Depends(get_db)):
+@async_endpoint
+def delete_company(company_id: int, db: Session = Depends(get_session)):
     company = db.query(models.Company).filter(models.Company.id == company_id).first()
     if not company:
         raise HTTPException(
@@ -107,31 +208,85 @@ def delete_company(company_id: int, db: Session = Depends(get_db)):
 
     db.delete(company)
     db.commit()
+    invalidate(tag("company", company_id))
     return None
 
+def _company_detail_version(db: Session, company_id: int):
+    """
+    Versión del detalle en una sola query: updated_at de la compañía y
+    nº de filas + máximo updated_at de contactos, deals y actividades.
+    None si la compañía no existe.
+    """
+    Contact, Deal, Activity = models.Contact, models.Deal, models.Activity
+    contact_ids = select(Contact.id).where(Contact.company_id == company_id)
+    deal_ids = select(Deal.id).where(Deal.company_id == company_id)
+    in_company = or_(
+        Activity.deal_id.in_(deal_ids),
+        Activity.contact_id.in_(contact_ids),
+    )
+
+    def scalar(column, *criteria):
+        return select(column).where(*criteria).scalar_subquery()
+
+    return (
+        db.query(
+            models.Company.updated_at,
+            scalar(func.count(Contact.id), Contact.company_id == company_id),
+            scalar(func.max(Contact.updated_at), Contact.company_id == company_id),
+            scalar(func.count(Deal.id), Deal.company_id == company_id),
+            scalar(func.max(Deal.updated_at), Deal.company_id == company_id),
+            scalar(func.count(Activity.id), in_company),
+            scalar(func.max(Activity.updated_at), in_company),
+        )
+        .filter(models.Company.id == company_id)
+        .first()
+    )
+
+
 @router.get("/{company_id}/detail", response_model=schemas.CompanyDetail)
-def get_company_detail(company_id: int, db: Session = Depends(get_db)):
+@cached_response(
+    # "companies": las escrituras de actividades invalidan todos los detalles
+    lambda params, detail: [tag("company", params["company_id"]), "companies"]
+)
+@async_endpoint
+def get_company_detail(
+    company_id: int,
+    request: Request,
+    response: Response,
+    contacts_skip: int = 0,
+    contacts_limit: int = 50,
+    deals_skip: int = 0,
+    deals_limit: int = 50,
+    db: Session = Depends(get_read_session),
+):
     """
     Devuelve:
     - datos de la compañía
-    - contactos relacionados
-    - deals relacionados
+    - contactos relacionados (paginados: contacts_skip / contacts_limit)
+    - deals relacionados (paginados: deals_skip / deals_limit)
     - actividades recientes ligadas a esa compañía
+    Los totales de contactos y deals van en contacts_total / deals_total.
     """
-    company = (
-        db.query(models.Company)
-        .options(
-            joinedload(models.Company.contacts),
-            joinedload(models.Company.deals),
-        )
-        .filter(models.Company.id == company_id)
-        .first()
+    version = _company_detail_version(db, company_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Company not found")
+
+    page = (contacts_skip, contacts_limit, deals_skip, deals_limit)
+    unchanged = respond_if_unchanged(
+        request, response, weak_etag("company-detail", company_id, *version, *page)
     )
+    if unchanged is not None:
+        return unchanged
+    _, contacts_total, _, deals_total, _, _, _ = version
+
+    company = db.query(models.Company).filter(models.Company.id == company_id).first()
 
     if not company:
         raise HTTPException(status_code=404, detail="Company not found")
 
-    # contactos
+    # contactos y deals: una query acotada por colección (un joinedload de las
+    # dos multiplicaba contactos x deals filas)
+    Contact, Deal = models.Contact, models.Deal
     contacts = [
         schemas.ContactSummary(
             id=c.id,
@@ -141,10 +296,14 @@ def get_company_detail(company_id: int, db: Session = Depends(get_db)):
             email=c.email,
             phone=c.phone,
         )
-        for c in getattr(company, "contacts", [])
+        for c in collection_page(
+            db.query(Contact).filter(Contact.company_id == company_id),
+            (Contact.created_at.desc(), Contact.id.desc()),
+            contacts_skip,
+            contacts_limit,
+        )
     ]
 
-    # deals
     deals = [
         schemas.DealSummary(
             id=d.id,
@@ -153,14 +312,23 @@ def get_company_detail(company_id: int, db: Session = Depends(get_db)):
             amount=float(d.amount or 0),
             close_date=d.close_date,
         )
-        for d in getattr(company, "deals", [])
+        for d in collection_page(
+            db.query(Deal).filter(Deal.company_id == company_id),
+            (Deal.created_at.desc(), Deal.id.desc()),
+            deals_skip,
+            deals_limit,
+        )
     ]
 
     # actividades ligadas a esta compañía
     activities_query = (
     db.query(models.Activity)
-    .outerjoin(models.Deal, models.Activity.deal_id == models.Deal.id)
-    .outerjoin(models.Contact, models.Activity.contact_id == models.Contact.id)
+    .outerjoin(models.Activity.deal)
+    .outerjoin(models.Activity.contact)
+    .options(
+        contains_eager(models.Activity.deal),
+        contains_eager(models.Activity.contact),
+    )
     .filter(
         or_(
             models.Deal.company_id == company_id,
@@ -199,6 +367,8 @@ def get_company_detail(company_id: int, db: Session = Depends(get_db)):
         phone=company.phone,
         address=company.address,
         contacts=contacts,
+        contacts_total=contacts_total,
         deals=deals,
+        deals_total=deals_total,
         activities=activities,
     )
\ No newline at end of file
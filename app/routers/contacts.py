@@ -1,11 +1,20 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, contains_eager, joinedload
 
-from app import models, schemas
-from app.database import get_db
-from sqlalchemy.orm import joinedload
+from app import export, models, schemas
+from app.batch import fetch_batch, parse_ids
+from app.cache import cached_response, invalidate, tag
+from app.database import async_endpoint, flush_or_400, get_read_session, get_session
+from app.etag import respond_if_unchanged, set_etag, wants_revalidation, weak_etag
+from app.fields import load_columns, parse_fields
+from app.importer import DEFAULT_CHUNK_SIZE, run_import
+from app.pagination import collection_page, keyset_paginate
+from app.responses import list_response
+from app.search import search_page
+from app.upsert import upsert_by_key
 
 router = APIRouter(
     prefix="/contacts",
@@ -13,73 +22,230 @@ router = APIRouter(
 )
 
 
+CONTACT_FIELDS = tuple(schemas.ContactOut.model_fields)
+
+
 @router.get("/", response_model=List[schemas.ContactOut])
+@async_endpoint
 def list_contacts(
     search: Optional[str] = None,
     company_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    response: Response = None,
+    db: Session = Depends(get_read_session),
 ):
     query = db.query(models.Contact)
+    selected = parse_fields(fields, schemas.ContactOut)
+
+    if company_id:
+        query = query.filter(models.Contact.company_id == company_id)
+
+    # ContactOut no lleva nombres enriquecidos: no hace falta el join con company
+    if selected is not None:
+        query = query.options(
+            load_columns(models.Contact, selected, models.Contact.created_at)
+        )
 
     if search:
-        like = f"%{search}%"
-        query = query.filter(
-            (models.Contact.first_name.ilike(like)) |
-            (models.Contact.last_name.ilike(like)) |
-            (models.Contact.email.ilike(like))
+        # índice de texto completo, resultados por relevancia
+        contacts_orm = search_page(
+            query,
+            models.Contact,
+            search,
+            cursor=cursor,
+            skip=skip,
+            limit=limit,
+            response=response,
+        )
+    else:
+        contacts_orm = keyset_paginate(
+            query,
+            models.Contact.created_at,
+            models.Contact.id,
+            cursor=cursor,
+            skip=skip,
+            limit=limit,
+            response=response,
+            descending=True,
         )
 
-    if company_id:
-        query = query.filter(models.Contact.company_id == company_id)
+    return list_response(
+        contacts_orm, selected or CONTACT_FIELDS, {}, response
+    )
 
-    # 👇 SIEMPRE se ejecuta, da igual los if anteriores
-    contacts_orm = (
-        query
-        .options(joinedload(models.Contact.company))
-        .order_by(models.Contact.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
+
+@router.get("/export")
+async def export_contacts(
+    format: str = "csv",
+    company_id: Optional[int] = None,
+    owner_user_id: Optional[int] = None,
+):
+    """Exporta todos los contactos (con nombre de compañía) en stream."""
+    return export.export_response(
+        export.contacts_statement(company_id, owner_user_id),
+        export.contact_row,
+        export.CONTACT_FIELDS,
+        format,
+        "contacts",
     )
 
-    # Construimos la respuesta incluyendo company_name
-    return [
-        schemas.ContactOut(
-            id=c.id,
-            first_name=c.first_name,
-            last_name=c.last_name,
-            email=c.email,
-            phone=c.phone,
-            position=c.position,
-            company_id=c.company_id,
-            company_name=c.company.name if c.company else None,
-            owner_user_id=c.owner_user_id,
-            tags=c.tags,
-            created_at=c.created_at,
-            updated_at=c.updated_at,
-        )
-        for c in contacts_orm
-    ]
+
+@router.post("/import", response_model=schemas.ImportReport)
+async def import_contacts(
+    request: Request,
+    format: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    db: Session = Depends(get_session),
+):
+    """
+    Importa contactos desde un body CSV (con cabecera) o NDJSON en stream.
+    Deduplica por email contra la tabla y dentro del propio fichero.
+    """
+    report = await run_import(
+        request,
+        db,
+        fmt=format,
+        chunk_size=chunk_size,
+        model=models.Contact,
+        schema=schemas.ContactCreate,
+        key_field="email",
+        json_fields=("tags",),
+    )
+    # los nuevos contactos aparecen en el detalle de sus compañías
+    invalidate("companies")
+    return report
+
+
+@router.put("/upsert", response_model=schemas.UpsertReport)
+@async_endpoint
+def upsert_contacts(
+    items: List[schemas.ContactUpsert],
+    db: Session = Depends(get_session),
+):
+    """
+    Crea o actualiza contactos por `email` (sincronización con el ERP).
+    Devuelve cuántos se han insertado, actualizado o no cambiaban.
+    """
+    report, tags = upsert_by_key(db, models.Contact, "email", items, _upsert_cache_tags)
+    invalidate(*tags)
+    return report
+
+
+def _upsert_cache_tags(existing: Optional[models.Contact], values: dict):
+    new_company = tag("company", values.get("company_id"))
+    if existing is None:
+        return (new_company,)
+    return (*_cache_tags(existing), new_company)
+
+
+@router.get("/batch", response_model=schemas.ContactBatch)
+@async_endpoint
+def get_contacts_batch(ids: str, db: Session = Depends(get_read_session)):
+    """Varios contactos por id (`?ids=3,1,2`) en una query, en el orden pedido."""
+    items, missing = fetch_batch(
+        db.query(models.Contact), models.Contact.id, parse_ids(ids)
+    )
+    return {"items": items, "missing": missing}
+
 
 @router.get("/{contact_id}", response_model=schemas.ContactOut)
-def get_contact(contact_id: int, db: Session = Depends(get_db)):
+@async_endpoint
+def get_contact(
+    contact_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_session),
+):
+    if wants_revalidation(request):
+        # solo leemos updated_at para decidir si basta con un 304
+        updated_at = (
+            db.query(models.Contact.updated_at)
+            .filter(models.Contact.id == contact_id)
+            .scalar()
+        )
+        if updated_at is not None:
+            unchanged = respond_if_unchanged(
+                request, response, weak_etag("contact", contact_id, updated_at)
+            )
+            if unchanged is not None:
+                return unchanged
+
     contact = db.query(models.Contact).filter(models.Contact.id == contact_id).first()
     if not contact:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Contact not found",
         )
+    set_etag(response, weak_etag("contact", contact.id, contact.updated_at))
     return contact
+
+
+def _contact_detail_version(db: Session, contact_id: int):
+    """
+    Versión del detalle en una sola query: updated_at del contacto y de su
+    compañía, y nº de filas + máximo updated_at de deals y actividades.
+    None si el contacto no existe.
+    """
+    Contact, Company, Deal, Activity = (
+        models.Contact, models.Company, models.Deal, models.Activity
+    )
+
+    def scalar(column, *criteria):
+        return select(column).where(*criteria).scalar_subquery()
+
+    return (
+        db.query(
+            Contact.updated_at,
+            scalar(Company.updated_at, Company.id == Contact.company_id),
+            scalar(func.count(Deal.id), Deal.contact_id == contact_id),
+            scalar(func.max(Deal.updated_at), Deal.contact_id == contact_id),
+            scalar(func.count(Activity.id), Activity.contact_id == contact_id),
+            scalar(func.max(Activity.updated_at), Activity.contact_id == contact_id),
+        )
+        .filter(Contact.id == contact_id)
+        .first()
+    )
+
 #---- ENDPOINT PARA DETALLE COMPLETO DEL CONTACTO ----#
 
 @router.get("/{contact_id}/detail", response_model=schemas.ContactDetail)
-def get_contact_detail(contact_id: int, db: Session = Depends(get_db)):
+@cached_response(
+    lambda params, detail: [
+        tag("contact", params["contact_id"]),
+        tag("company", detail.company_id),
+    ]
+)
+@async_endpoint
+def get_contact_detail(
+    contact_id: int,
+    request: Request,
+    response: Response,
+    deals_skip: int = 0,
+    deals_limit: int = 50,
+    db: Session = Depends(get_read_session),
+):
+    version = _contact_detail_version(db, contact_id)
+    if version is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Contact not found",
+        )
+
+    unchanged = respond_if_unchanged(
+        request,
+        response,
+        weak_etag("contact-detail", contact_id, *version, deals_skip, deals_limit),
+    )
+    if unchanged is not None:
+        return unchanged
+    deals_total = version[2]
+
     contact = (
         db.query(models.Contact)
-        .options(joinedload(models.Contact.company),
-                 joinedload(models.Contact.deals))
+        .options(joinedload(models.Contact.company))
         .filter(models.Contact.id == contact_id)
         .first()
     )
@@ -89,7 +255,8 @@ def get_contact_detail(contact_id: int, db: Session = Depends(get_db)):
             detail="Contact not found",
         )
 
-    # deals del contacto
+    # deals del contacto: query aparte y paginada (deals_skip / deals_limit)
+    Deal = models.Deal
     deals = [
         schemas.DealSummary(
             id=d.id,
@@ -98,13 +265,19 @@ def get_contact_detail(contact_id: int, db: Session = Depends(get_db)):
             amount=float(d.amount or 0),
             close_date=d.close_date,
         )
-        for d in getattr(contact, "deals", [])
+        for d in collection_page(
+            db.query(Deal).filter(Deal.contact_id == contact_id),
+            (Deal.created_at.desc(), Deal.id.desc()),
+            deals_skip,
+            deals_limit,
+        )
     ]
 
     # actividades ligadas al contacto
     activities_q = (
         db.query(models.Activity)
-        .outerjoin(models.Deal, models.Activity.deal_id == models.Deal.id)
+        .outerjoin(models.Activity.deal)
+        .options(contains_eager(models.Activity.deal))
         .filter(models.Activity.contact_id == contact_id)
         .order_by(models.Activity.due_date.desc())
         .limit(20)
@@ -135,35 +308,34 @@ def get_contact_detail(contact_id: int, db: Session = Depends(get_db)):
         company_name=contact.company.name if contact.company else None,
         company_industry=contact.company.industry if contact.company else None,
         deals=deals,
+        deals_total=deals_total,
         activities=activities,
     )
 
-@router.post("/", response_model=schemas.ContactOut, status_code=status.HTTP_201_CREATED)
-def create_contact(contact_in: schemas.ContactCreate, db: Session = Depends(get_db)):
-    if contact_in.email:
-        existing = (
-            db.query(models.Contact)
-            .filter(models.Contact.email == contact_in.email)
-            .first()
-        )
-        if existing:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Contact with this email already exists",
-            )
+def _cache_tags(contact: models.Contact):
+    """Entradas de caché que muestran este contacto (el dashboard, por su nombre)."""
+    return ("dashboard", tag("contact", contact.id), tag("company", contact.company_id))
+
 
+@router.post("/", response_model=schemas.ContactOut, status_code=status.HTTP_201_CREATED)
+@async_endpoint
+def create_contact(contact_in: schemas.ContactCreate, db: Session = Depends(get_session)):
     contact = models.Contact(**contact_in.dict())
     db.add(contact)
+    # el email repetido lo detecta el índice único (-> 400)
+    flush_or_400(db, "Contact with this email already exists")
+    out = schemas.ContactOut.model_validate(contact, from_attributes=True)
     db.commit()
-    db.refresh(contact)
-    return contact
+    invalidate(tag("company", out.company_id))
+    return out
 
 
 @router.patch("/{contact_id}", response_model=schemas.ContactOut)
+@async_endpoint
 def update_contact(
     contact_id: int,
     contact_in: schemas.ContactUpdate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
 ):
     contact = db.query(models.Contact).filter(models.Contact.id == contact_id).first()
     if not contact:
@@ -172,17 +344,22 @@ def update_contact(
             detail="Contact not found",
         )
 
+    stale_tags = _cache_tags(contact)
     data = contact_in.dict(exclude_unset=True)
     for field, value in data.items():
         setattr(contact, field, value)
 
+    flush_or_400(db, "Contact with this email already exists")
+    out = schemas.ContactOut.model_validate(contact, from_attributes=True)
+    tags = _cache_tags(contact)
     db.commit()
-    db.refresh(contact)
-    return contact
+    invalidate(*stale_tags, *tags)
+    return out
 
 
 @router.delete("/{contact_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_contact(contact_id: int, db: Session = Depends(get_db)):
+@async_endpoint
+def delete_contact(contact_id: int, db: Session = Depends(get_session)):
     contact = db.query(models.Contact).filter(models.Contact.id == contact_id).first()
     if not contact:
         raise HTTPException(
@@ -190,6 +367,8 @@ def delete_contact(contact_id: int, db: Session = Depends(get_db)):
             detail="Contact not found",
         )
 
+    stale_tags = _cache_tags(contact)
     db.delete(contact)
     db.commit()
+    invalidate(*stale_tags)
     return None
@@ -1,12 +1,14 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session, joinedload
 
 from app import models, schemas
-from app.database import get_db
+from app.aggregates import STAGE_PROBABILITY, pipeline_by_stage
+from app.cache import cached_response
+from app.database import async_endpoint, get_read_session
+from app.snapshots import GRANULARITIES, default_range, pipeline_trends
 
 router = APIRouter(
     prefix="/dashboard",
@@ -15,10 +17,12 @@ router = APIRouter(
 
 
 @router.get("/summary", response_model=schemas.DashboardSummary)
+@cached_response(lambda params, summary: ["dashboard"])
+@async_endpoint
 def get_dashboard_summary(
     owner_user_id: Optional[int] = None,
     days_ahead: int = 7,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_session),
 ):
     """
     Resumen de pipeline + actividades próximas.
@@ -26,18 +30,8 @@ def get_dashboard_summary(
     - days_ahead: rango de días para actividades próximas
     """
     # ---------- DEALS POR ETAPA ----------
-    deals_query = db.query(
-        models.Deal.stage.label("stage"),
-        func.count(models.Deal.id).label("count"),
-        func.coalesce(func.sum(models.Deal.amount), 0).label("total_amount"),
-    )
-
-    if owner_user_id:
-        deals_query = deals_query.filter(models.Deal.owner_user_id == owner_user_id)
-
-    deals_query = deals_query.group_by(models.Deal.stage)
-
-    deals_by_stage_rows = deals_query.all()
+    # leemos el rollup incremental (pocas filas) en vez de agrupar todos los deals
+    deals_by_stage_rows = pipeline_by_stage(db, owner_user_id)
 
     deals_by_stage: List[schemas.DealStageStats] = [
         schemas.DealStageStats(
@@ -53,17 +47,9 @@ def get_dashboard_summary(
     )
 
     # --------- VALOR ESPERADO DEL PIPELINE ---------
-    stage_prob = {
-        "prospecting": 0.2,
-        "qualified": 0.4,
-        "proposal": 0.7,
-        "won": 1.0,
-        "lost": 0.0,
-    }
-
     expected_pipeline_value = 0.0
     for d in deals_by_stage:
-        prob = stage_prob.get(d.stage, 0.0)
+        prob = STAGE_PROBABILITY.get(d.stage, 0.0)
         expected_pipeline_value += d.total_amount * prob
 
     # ---------- ACTIVIDADES PRÓXIMAS ----------
@@ -115,3 +101,52 @@ def get_dashboard_summary(
         expected_pipeline_value=expected_pipeline_value,   # ⬅️ NUEVO
         upcoming_activities=upcoming_activities,
     )
+
+
+@router.get("/trends", response_model=schemas.PipelineTrends)
+@cached_response(lambda params, trends: ["pipeline_snapshots"])
+@async_endpoint
+def get_dashboard_trends(
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    owner_user_id: Optional[int] = None,
+    granularity: str = "day",
+    db: Session = Depends(get_read_session),
+):
+    """
+    Evolución del pipeline por etapa, leída de las fotos diarias
+    (`python -m app.snapshots`).
+    - from_date / to_date: rango (por defecto las últimas 8 semanas)
+    - owner_user_id: filtra por comercial (opcional)
+    - granularity: day | week (última foto de cada semana)
+    """
+    if granularity not in GRANULARITIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid granularity (use day or week)",
+        )
+    default_from, default_to = default_range()
+    from_date = from_date or default_from
+    to_date = to_date or default_to
+    if from_date > to_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="from_date must be before to_date",
+        )
+
+    points = [
+        schemas.PipelineTrendPoint(
+            snapshot_date=point["snapshot_date"],
+            stages=point["stages"],
+            total_pipeline_value=sum(s["total_amount"] for s in point["stages"]),
+            expected_pipeline_value=sum(s["expected_value"] for s in point["stages"]),
+        )
+        for point in pipeline_trends(db, from_date, to_date, owner_user_id, granularity)
+    ]
+
+    return schemas.PipelineTrends(
+        from_date=from_date,
+        to_date=to_date,
+        granularity=granularity,
+        points=points,
+    )
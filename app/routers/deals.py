@@ -1,10 +1,21 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload  # 👈 joinedload añadido
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import update
+from sqlalchemy.orm import Session, contains_eager, joinedload  # 👈 joinedload añadido
 
-from app import models, schemas
-from app.database import get_db
+from app import export, models, schemas
+from app.aggregates import deal_state, record_deal_change, record_stage_change
+from app.batch import fetch_batch, parse_ids, unique_ids
+from app.cache import invalidate, tag
+from app.changes import record_changes_from
+from app.database import async_endpoint, flush_or_400, get_read_session, get_session
+from app.etag import respond_if_unchanged, set_etag, wants_revalidation, weak_etag
+from app.events import hub
+from app.fields import model_columns, parse_fields
+from app.names import related_names
+from app.pagination import keyset_paginate
+from app.responses import list_response
 
 router = APIRouter(
     prefix="/deals",
@@ -13,15 +24,21 @@ router = APIRouter(
 
 
 @router.get("/", response_model=List[schemas.DealOut])
+@async_endpoint
 def list_deals(
     stage: Optional[str] = None,
     company_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 50,
     owner_user_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    response: Response = None,
+    db: Session = Depends(get_read_session),
 ):
-    query = db.query(models.Deal)
+    selected = parse_fields(fields, schemas.DealOut)
+    out_fields = selected or DEAL_FIELDS
+    query = _list_query(db, out_fields)
 
     if stage:
         query = query.filter(models.Deal.stage == stage)
@@ -32,60 +49,175 @@ def list_deals(
     if owner_user_id:
         query = query.filter(models.Deal.owner_user_id == owner_user_id)
 
-    deals_orm = (
-        query
-        .options(
-            joinedload(models.Deal.company),
-            joinedload(models.Deal.contact),
+    rows = keyset_paginate(
+        query,
+        models.Deal.created_at,
+        models.Deal.id,
+        cursor=cursor,
+        skip=skip,
+        limit=limit,
+        response=response,
+        descending=True,
+    )
+
+    # DealOut enriquecido con nombres de company/contact, ya serializado
+    return list_response(rows, out_fields, DEAL_ENRICHED, response)
+
+
+def _list_query(db: Session, out_fields):
+    """
+    Filas planas (sin objetos ORM) con solo las columnas de `out_fields`
+    (+ la del cursor) y solo los joins de los nombres pedidos.
+    """
+    Deal, Company, Contact = models.Deal, models.Company, models.Contact
+    query = db.query(*model_columns(Deal, out_fields, Deal.created_at))
+    if "company_name" in out_fields:
+        query = query.add_columns(Company.name.label("company_name")).outerjoin(
+            Company, Deal.company_id == Company.id
         )
-        .order_by(models.Deal.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
+    if "contact_name" in out_fields:
+        query = query.add_columns(
+            Contact.first_name.label("contact_first_name"),
+            Contact.last_name.label("contact_last_name"),
+        ).outerjoin(Contact, Deal.contact_id == Contact.id)
+    return query
+
+
+@router.get("/export")
+async def export_deals(
+    format: str = "csv",
+    stage: Optional[str] = None,
+    company_id: Optional[int] = None,
+    owner_user_id: Optional[int] = None,
+):
+    """Exporta todos los deals (con nombres de company/contact) en stream."""
+    return export.export_response(
+        export.deals_statement(stage, company_id, owner_user_id),
+        export.deal_row,
+        export.DEAL_FIELDS,
+        format,
+        "deals",
     )
 
-    # devolvemos DealOut enriquecido con nombres de company/contact
-    return [
-        schemas.DealOut(
-            id=d.id,
-            title=d.title,
-            amount=float(d.amount or 0),
-            currency=d.currency,
-            stage=d.stage,
-            close_date=d.close_date,
-            company_id=d.company_id,
-            contact_id=d.contact_id,
-            owner_user_id=d.owner_user_id,
-            company_name=d.company.name if d.company else None,
-            contact_name=(
-                f"{d.contact.first_name} {d.contact.last_name}"
-                if d.contact
-                else None
-            ),
-            created_at=d.created_at,
-            updated_at=d.updated_at,
+
+@router.get("/batch", response_model=schemas.DealBatch)
+@async_endpoint
+def get_deals_batch(ids: str, db: Session = Depends(get_read_session)):
+    """Varios deals por id (`?ids=3,1,2`) en una query, en el orden pedido."""
+    items, missing = fetch_batch(
+        _enriched_query(db), models.Deal.id, parse_ids(ids), deal_to_out
+    )
+    return {"items": items, "missing": missing}
+
+
+@router.patch("/stage", response_model=schemas.DealBatch)
+@async_endpoint
+def update_deals_stage(
+    stage_in: schemas.DealStageBulkUpdate,
+    db: Session = Depends(get_session),
+):
+    """
+    Mueve varios deals a una etapa (columna del kanban) con un solo UPDATE.
+    Devuelve los deals en el orden pedido y los ids que no existen.
+    """
+    if stage_in.stage not in models.DEAL_STAGES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid stage",
         )
-        for d in deals_orm
-    ]
+    ids = unique_ids(stage_in.ids)
+    if not ids:
+        return {"items": [], "missing": []}
+
+    record_stage_change(db, ids, stage_in.stage)
+    # el filtro se evalúa en el commit, ya con la etapa nueva: van todos
+    # los ids pedidos (uno que no cambiaba solo se manda de más en el feed)
+    record_changes_from(db, models.Deal, models.Deal.id.in_(ids))
+    db.execute(
+        update(models.Deal)
+        .where(models.Deal.id.in_(ids), models.Deal.stage != stage_in.stage)
+        .values(stage=stage_in.stage)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    items, missing = fetch_batch(
+        _enriched_query(db), models.Deal.id, ids, deal_to_out
+    )
+    invalidate(
+        "dashboard",
+        *(tag("company", d.company_id) for d in items),
+        *(tag("contact", d.contact_id) for d in items),
+    )
+    for d in items:
+        hub.publish("deal.updated", d, [d.owner_user_id])
+    return {"items": items, "missing": missing}
 
 
 @router.get("/{deal_id}", response_model=schemas.DealOut)
-def get_deal(deal_id: int, db: Session = Depends(get_db)):
-    d = (
-        db.query(models.Deal)
-        .options(
-            joinedload(models.Deal.company),
-            joinedload(models.Deal.contact),
+@async_endpoint
+def get_deal(
+    deal_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_session),
+):
+    if wants_revalidation(request):
+        # versión = updated_at del deal y de su compañía/contacto (por los nombres)
+        version = (
+            db.query(
+                models.Deal.updated_at,
+                models.Company.updated_at,
+                models.Contact.updated_at,
+            )
+            .outerjoin(models.Company, models.Deal.company_id == models.Company.id)
+            .outerjoin(models.Contact, models.Deal.contact_id == models.Contact.id)
+            .filter(models.Deal.id == deal_id)
+            .first()
         )
-        .filter(models.Deal.id == deal_id)
-        .first()
+        if version is not None:
+            unchanged = respond_if_unchanged(
+                request, response, weak_etag("deal", deal_id, *version)
+            )
+            if unchanged is not None:
+                return unchanged
+
+    d = load_deal(db, deal_id)
+    set_etag(
+        response,
+        weak_etag(
+            "deal",
+            d.id,
+            d.updated_at,
+            d.company.updated_at if d.company else None,
+            d.contact.updated_at if d.contact else None,
+        ),
     )
-    if not d:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Deal not found",
-        )
+    return deal_to_out(d)
+
+
+def deal_to_out(d: models.Deal) -> schemas.DealOut:
+    """DealOut enriquecido; `company` y `contact` deben venir ya cargados."""
+    return _deal_out(
+        d,
+        d.company.name if d.company else None,
+        f"{d.contact.first_name} {d.contact.last_name}" if d.contact else None,
+    )
+
 
+def written_deal_out(db: Session, d: models.Deal) -> schemas.DealOut:
+    """
+    DealOut de un deal recién escrito (después del flush y antes del commit),
+    sin volver a leerlo: los nombres salen de app.names.
+    """
+    return _deal_out(d, *related_names(db, d.company_id, d.contact_id))
+
+
+def _deal_out(
+    d: models.Deal,
+    company_name: Optional[str],
+    contact_name: Optional[str],
+) -> schemas.DealOut:
     return schemas.DealOut(
         id=d.id,
         title=d.title,
@@ -96,94 +228,171 @@ def get_deal(deal_id: int, db: Session = Depends(get_db)):
         company_id=d.company_id,
         contact_id=d.contact_id,
         owner_user_id=d.owner_user_id,
-        company_name=d.company.name if d.company else None,
-        contact_name=(
-            f"{d.contact.first_name} {d.contact.last_name}"
-            if d.contact
-            else None
-        ),
+        company_name=company_name,
+        contact_name=contact_name,
         created_at=d.created_at,
         updated_at=d.updated_at,
     )
 
 
+DEAL_FIELDS = tuple(schemas.DealOut.model_fields)
+
+# campos de DealOut que se calculan desde las filas de `_list_query`
+DEAL_ENRICHED = {
+    "amount": lambda row: float(row.amount or 0),
+    "contact_name": lambda row: (
+        f"{row.contact_first_name} {row.contact_last_name}"
+        if row.contact_first_name is not None
+        else None
+    ),
+}
+
+
+def _cache_tags(deal: models.Deal):
+    """Entradas de caché que muestran este deal."""
+    return ("dashboard", tag("company", deal.company_id), tag("contact", deal.contact_id))
+
+
+def _enriched_query(db: Session):
+    return db.query(models.Deal).options(
+        joinedload(models.Deal.company),
+        joinedload(models.Deal.contact),
+    )
+
+
+def load_deal(db: Session, deal_id: int) -> models.Deal:
+    """Deal con company y contact cargados; 404 si no existe."""
+    d = _enriched_query(db).filter(models.Deal.id == deal_id).first()
+    if not d:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Deal not found",
+        )
+    return d
+
+
 @router.post("/", response_model=schemas.DealOut, status_code=status.HTTP_201_CREATED)
+@async_endpoint
 def create_deal(
     deal_in: schemas.DealCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
 ):
     deal = models.Deal(**deal_in.dict())
     db.add(deal)
+    flush_or_400(db)
+    record_deal_change(db, None, deal_state(deal))
+    # la respuesta sale del objeto ya escrito: sin refresh ni segunda lectura
+    out = written_deal_out(db, deal)
+    tags = _cache_tags(deal)
     db.commit()
-    db.refresh(deal)
-    # reutilizamos get_deal para devolverlo enriquecido con nombres
-    return get_deal(deal.id, db)
+    invalidate(*tags)
+    hub.publish("deal.created", out, [out.owner_user_id])
+    return out
 
 
 @router.patch("/{deal_id}", response_model=schemas.DealOut)
+@async_endpoint
 def update_deal(
     deal_id: int,
     deal_in: schemas.DealUpdate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
 ):
-    deal = db.query(models.Deal).filter(models.Deal.id == deal_id).first()
+    # bloquea el deal hasta el commit (MySQL): dos PATCH a la vez no pueden
+    # partir del mismo `before` y sumar los dos deltas al rollup
+    deal = (
+        db.query(models.Deal)
+        .filter(models.Deal.id == deal_id)
+        .with_for_update()
+        .first()
+    )
     if not deal:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Deal not found",
         )
 
+    before = deal_state(deal)
+    stale_tags = _cache_tags(deal)
     data = deal_in.dict(exclude_unset=True)
     for field, value in data.items():
         setattr(deal, field, value)
 
+    record_deal_change(db, before, deal_state(deal))
+    flush_or_400(db)
+    out = written_deal_out(db, deal)
+    tags = _cache_tags(deal)
     db.commit()
-    db.refresh(deal)
-    return get_deal(deal.id, db)
+    invalidate(*stale_tags, *tags)
+    hub.publish("deal.updated", out, [before.owner_user_id, out.owner_user_id])
+    return out
 
 
 @router.patch("/{deal_id}/stage", response_model=schemas.DealOut)
+@async_endpoint
 def update_deal_stage(
     deal_id: int,
     stage: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
 ):
-    if stage not in ["prospecting", "qualified", "proposal", "won", "lost"]:
+    if stage not in models.DEAL_STAGES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid stage",
         )
 
-    deal = db.query(models.Deal).filter(models.Deal.id == deal_id).first()
+    deal = (
+        db.query(models.Deal)
+        .filter(models.Deal.id == deal_id)
+        .with_for_update()
+        .first()
+    )
     if not deal:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Deal not found",
         )
 
+    before = deal_state(deal)
     deal.stage = stage
+    record_deal_change(db, before, deal_state(deal))
+    flush_or_400(db)
+    out = written_deal_out(db, deal)
+    tags = _cache_tags(deal)
     db.commit()
-    db.refresh(deal)
-    return get_deal(deal.id, db)
+    invalidate(*tags)
+    hub.publish("deal.updated", out, [out.owner_user_id])
+    return out
 
 
 @router.delete("/{deal_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_deal(deal_id: int, db: Session = Depends(get_db)):
-    deal = db.query(models.Deal).filter(models.Deal.id == deal_id).first()
+@async_endpoint
+def delete_deal(deal_id: int, db: Session = Depends(get_session)):
+    deal = (
+        db.query(models.Deal)
+        .filter(models.Deal.id == deal_id)
+        .with_for_update()
+        .first()
+    )
     if not deal:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Deal not found",
         )
 
+    stale_tags = _cache_tags(deal)
+    owner_user_id = deal.owner_user_id
+    record_deal_change(db, deal_state(deal), None)
     db.delete(deal)
     db.commit()
+    invalidate(*stale_tags)
+    hub.publish("deal.deleted", {"id": deal_id}, [owner_user_id])
     return None
 
 @router.get("/{deal_id}/activities", response_model=List[schemas.ActivitySummary])
+@async_endpoint
 def get_deal_activities(
     deal_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_session),
 ):
     """
     Devuelve las actividades ligadas a un deal concreto,
@@ -198,7 +407,8 @@ def get_deal_activities(
 
     query = (
         db.query(models.Activity)
-        .outerjoin(models.Contact)
+        .outerjoin(models.Activity.contact)
+        .options(contains_eager(models.Activity.contact))
         .filter(models.Activity.deal_id == deal_id)
         .order_by(models.Activity.due_date.desc())
         .limit(30)
@@ -0,0 +1,52 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+
+from app.config import EVENTS_HEARTBEAT_SECONDS
+from app.events import format_sse, hub
+
+router = APIRouter(
+    prefix="/events",
+    tags=["events"],
+)
+
+# ms que espera EventSource antes de reconectar
+RETRY_MS = 3000
+
+
+async def _event_stream(owner_user_id: Optional[int]):
+    subscriber = hub.subscribe(owner_user_id)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    subscriber.queue.get(), EVENTS_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                # comentario SSE: mantiene viva la conexión a través de proxies
+                yield ": ping\n\n"
+                continue
+            yield format_sse(event)
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+@router.get("")
+async def stream_events(owner_user_id: Optional[int] = None):
+    """
+    Server-Sent Events con los cambios de deals y actividades:
+    - `deal.created` / `deal.updated` / `activity.created` / `activity.updated`:
+      `data` es el DealOut / ActivityOut escrito
+    - `deal.deleted` / `activity.deleted`: `data` = {"id": ...}
+    - `resync`: se han perdido eventos (cliente lento o backend caído);
+      recargar lo que se esté mostrando
+    - owner_user_id: solo eventos de ese comercial (opcional)
+    """
+    return StreamingResponse(
+        _event_stream(owner_user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,30 @@
+from fastapi import APIRouter
+
+from app import database
+from app.pool import pool_metrics
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"],
+)
+
+
+@router.get("/pool")
+async def get_pool_metrics():
+    """
+    Estado de los pools de conexiones de este proceso:
+    - size / max_overflow / timeout: configuración (CRM_DB_POOL_*)
+    - checked_out / checked_in / overflow: conexiones ahora mismo
+    - acquisitions, timeouts, wait_ms_*: acumulados desde el arranque
+    Las réplicas de lectura van en `replicas` / `replicas_async`.
+    """
+    pools = {"primary": pool_metrics(database.engine)}
+    if database.async_engine is not None:
+        pools["primary_async"] = pool_metrics(database.async_engine)
+    if database.read_replicas:
+        pools["replicas"] = [pool_metrics(e) for e in database.read_replicas.engines]
+    if database.async_read_replicas:
+        pools["replicas_async"] = [
+            pool_metrics(e) for e in database.async_read_replicas.engines
+        ]
+    return pools
@@ -101,6 +101,11 @@ class DealUpdate(BaseModel):
     owner_user_id: Optional[int] = None
 
 
+class DealStageBulkUpdate(BaseModel):
+    ids: List[int]
+    stage: str
+
+
 class DealOut(DealBase):
     id: int
     created_at: datetime
@@ -149,6 +154,7 @@ class ActivityOut(BaseModel):
     contact_id: Optional[int]
     owner_user_id: Optional[int]
     created_at: datetime
+    updated_at: datetime
 
     # 👇 NUEVOS CAMPOS
     contact_name: Optional[str] = None
@@ -159,6 +165,21 @@ class ActivityOut(BaseModel):
         orm_mode = True
 
 
+class ActivityCalendarBucket(BaseModel):
+    bucket: str   # "2026-10-17" (day) o "2026-10-17T09:00:00" (hour)
+    type: str
+    done: bool
+    count: int
+
+
+class ActivityCalendar(BaseModel):
+    granularity: str
+    due_from: datetime
+    due_to: datetime
+    total: int
+    buckets: List[ActivityCalendarBucket]
+
+
 # --------- DASHBOARD ---------
 class DealStageStats(BaseModel):
     stage: str
@@ -186,6 +207,27 @@ class DashboardSummary(BaseModel):
     expected_pipeline_value: float   
     upcoming_activities: List[UpcomingActivity]
 
+
+class TrendStageStats(BaseModel):
+    stage: str
+    count: int
+    total_amount: float
+    expected_value: float
+
+
+class PipelineTrendPoint(BaseModel):
+    snapshot_date: date
+    stages: List[TrendStageStats]
+    total_pipeline_value: float
+    expected_pipeline_value: float
+
+
+class PipelineTrends(BaseModel):
+    from_date: date
+    to_date: date
+    granularity: str
+    points: List[PipelineTrendPoint]
+
 class ContactSummary(BaseModel):
     id: int
     first_name: str
@@ -234,7 +276,9 @@ class CompanyDetail(BaseModel):
     address: Optional[str] = None
 
     contacts: List[ContactSummary]
+    contacts_total: int
     deals: List[DealSummary]
+    deals_total: int
     activities: List[ActivitySummary]
 
     class Config:
@@ -255,6 +299,7 @@ class ContactDetail(BaseModel):
     company_industry: Optional[str] = None
 
     deals: List[DealSummary]
+    deals_total: int
     activities: List[ActivitySummary]
 
     class Config:
@@ -283,4 +328,66 @@ class DealDetail(BaseModel):
     updated_at: datetime
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+# ---------- IMPORTACIÓN MASIVA ----------
+class ImportRowError(BaseModel):
+    row: int          # nº de registro en el fichero (1 = primera fila de datos)
+    error: str
+
+
+class ImportReport(BaseModel):
+    received: int
+    inserted: int
+    duplicates: int
+    errors: List[ImportRowError]
+
+
+class UpsertReport(BaseModel):
+    received: int
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+
+class ContactUpsert(ContactBase):
+    email: str   # clave natural del upsert
+
+
+# ---------- LECTURA POR LOTES ----------
+class CompanyBatch(BaseModel):
+    items: List[CompanyOut]   # en el orden de `ids`
+    missing: List[int]        # ids que no existen
+
+
+class ContactBatch(BaseModel):
+    items: List[ContactOut]
+    missing: List[int]
+
+
+class DealBatch(BaseModel):
+    items: List[DealOut]
+    missing: List[int]
+
+
+class ActivityBatch(BaseModel):
+    items: List[ActivityOut]
+    missing: List[int]
+
+
+# ---------- FEED DE CAMBIOS ----------
+class DeletedIds(BaseModel):
+    companies: List[int] = []
+    contacts: List[int] = []
+    deals: List[int] = []
+    activities: List[int] = []
+
+
+class ChangeFeed(BaseModel):
+    next_token: int    # `since` de la siguiente llamada
+    has_more: bool     # hay más cambios ya asentados: volver a llamar enseguida
+    companies: List[CompanyOut] = []
+    contacts: List[ContactOut] = []
+    deals: List[DealOut] = []
+    activities: List[ActivityOut] = []
+    deleted: DeletedIds = DeletedIds()
@@ -0,0 +1,253 @@
+"""
+Búsqueda de texto para contactos y compañías.
+
+En lugar de `ILIKE '%texto%'` (que obliga a recorrer la tabla entera) se usa
+un índice de texto completo mantenido por la propia base de datos:
+
+- MySQL: índices FULLTEXT + `MATCH ... AGAINST` en modo booleano.
+- SQLite: tablas virtuales FTS5 (external content) sincronizadas con
+  triggers, para poder probar en local.
+
+Cada término se busca por prefijo (`acm` encuentra `Acme`) y todos los
+términos tienen que aparecer. Los resultados se ordenan por relevancia.
+
+MySQL deja fuera del índice FULLTEXT dos tipos de palabras, y un término
+`+palabra*` obligatorio que no está en el índice no casa con nada:
+
+- las stopwords (la lista por defecto incluye `com`, `de`, `la`, `en`...):
+  buscar `juan@acme.com` o `de la Cruz` no devolvería nada. Por eso el
+  índice se crea con `innodb_ft_enable_stopword = OFF` (se aplica al crear
+  el índice; uno creado antes con stopwords hay que borrarlo y volver a
+  crearlo con `python -m app.search`);
+- las de menos de `innodb_ft_min_token_size` letras (3 por defecto, es una
+  variable global de solo lectura). Esos términos no van al MATCH: se
+  comprueban con LIKE sobre las filas que ya ha filtrado el índice.
+
+SQLite FTS5 no tiene ninguna de las dos limitaciones.
+
+Los índices se crean solos con `Base.metadata.create_all` y con la migración
+0002 (`alembic upgrade head`); para una base de datos ya existente también:
+
+    python -m app.search
+"""
+import re
+from typing import List, Optional
+
+from fastapi import Response
+from sqlalchemy import DDL, Float, Integer, event, literal, or_, select, text
+from sqlalchemy.dialects.mysql import match
+
+from app import models
+from app.pagination import keyset_paginate
+
+# columnas indexadas por tabla
+SEARCH_COLUMNS = {
+    "contacts": ("first_name", "last_name", "email"),
+    "companies": ("name", "city", "industry"),
+}
+
+MAX_TERMS = 8
+
+# innodb_ft_min_token_size por defecto: las palabras más cortas no se indexan
+MYSQL_MIN_TOKEN_SIZE = 3
+
+
+def _mysql_index_name(table: str) -> str:
+    return f"ft_{table}_search"
+
+
+def _fts_table(table: str) -> str:
+    return f"{table}_fts"
+
+
+def _sqlite_ddl(table: str) -> List[str]:
+    fts = _fts_table(table)
+    cols = SEARCH_COLUMNS[table]
+    col_list = ", ".join(cols)
+    new_values = ", ".join(f"new.{c}" for c in cols)
+    old_values = ", ".join(f"old.{c}" for c in cols)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{col_list}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {col_list}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {col_list}) "
+        f"VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {col_list}) "
+        f"VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {col_list}) VALUES (new.id, {new_values}); END",
+    ]
+
+
+def _mysql_ddl(table: str) -> List[str]:
+    cols = ", ".join(SEARCH_COLUMNS[table])
+    return [
+        # las stopwords no entrarían en el índice (ver docstring del módulo)
+        "SET SESSION innodb_ft_enable_stopword = OFF",
+        # bloquea las escrituras mientras se construye (InnoDB no admite
+        # LOCK=NONE con FULLTEXT): en tablas grandes, ver migrations/helpers.py
+        f"ALTER TABLE {table} ADD FULLTEXT INDEX "
+        f"{_mysql_index_name(table)} ({cols}), ALGORITHM=INPLACE, LOCK=SHARED",
+    ]
+
+
+# índices al crear las tablas desde cero (create_all)
+for _model in (models.Contact, models.Company):
+    _table = _model.__tablename__
+    for _stmt in _mysql_ddl(_table):
+        event.listen(
+            _model.__table__,
+            "after_create",
+            DDL(_stmt).execute_if(dialect="mysql"),
+        )
+    for _stmt in _sqlite_ddl(_table):
+        event.listen(
+            _model.__table__,
+            "after_create",
+            DDL(_stmt).execute_if(dialect="sqlite"),
+        )
+
+
+def create_search_indexes(conn) -> None:
+    """
+    Crea (si faltan) los índices de búsqueda sobre un esquema existente,
+    dentro de la transacción de `conn` (la usa también la migración 0002).
+    """
+    for table in SEARCH_COLUMNS:
+        if conn.dialect.name == "mysql":
+            exists = conn.execute(
+                text(
+                    "SELECT 1 FROM information_schema.statistics "
+                    "WHERE table_schema = DATABASE() "
+                    "AND table_name = :table AND index_name = :index"
+                ),
+                {"table": table, "index": _mysql_index_name(table)},
+            ).first()
+            if not exists:
+                for stmt in _mysql_ddl(table):
+                    conn.execute(text(stmt))
+        elif conn.dialect.name == "sqlite":
+            for stmt in _sqlite_ddl(table):
+                conn.execute(text(stmt))
+            fts = _fts_table(table)
+            # reindexa las filas que ya existían antes del trigger
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def drop_search_indexes(conn) -> None:
+    for table in SEARCH_COLUMNS:
+        if conn.dialect.name == "mysql":
+            conn.execute(text(f"DROP INDEX {_mysql_index_name(table)} ON {table}"))
+        elif conn.dialect.name == "sqlite":
+            fts = _fts_table(table)
+            for suffix in ("ai", "ad", "au"):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {fts}_{suffix}"))
+            conn.execute(text(f"DROP TABLE IF EXISTS {fts}"))
+
+
+def install_search_indexes(engine) -> None:
+    """Crea (si faltan) los índices de búsqueda sobre un esquema existente."""
+    with engine.begin() as conn:
+        create_search_indexes(conn)
+
+
+def search_terms(search: str) -> List[str]:
+    return re.findall(r"\w+", search.lower())[:MAX_TERMS]
+
+
+def ranked_matches(db, model, search: str):
+    """
+    Subconsulta (id, score) con las filas de `model` que casan con todos los
+    términos de `search`. Mayor `score` = más relevante.
+    Devuelve None si `search` no contiene ningún término.
+    """
+    terms = search_terms(search)
+    if not terms:
+        return None
+
+    table = model.__tablename__
+    columns = [getattr(model, c) for c in SEARCH_COLUMNS[table]]
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "mysql":
+        indexed = [t for t in terms if len(t) >= MYSQL_MIN_TOKEN_SIZE]
+        short = [t for t in terms if len(t) < MYSQL_MIN_TOKEN_SIZE]
+        if indexed:
+            score = match(
+                *columns, against=" ".join(f"+{t}*" for t in indexed)
+            ).in_boolean_mode()
+            return (
+                select(model.id.label("id"), score.label("score"))
+                .where(score > 0, *_like_conditions(columns, short))
+                .subquery()
+            )
+        # solo términos cortos: el índice no sirve, LIKE como en otros motores
+
+    if dialect == "sqlite":
+        fts = _fts_table(table)
+        # bm25() es más negativo cuanto más relevante: lo invertimos
+        return (
+            text(
+                f"SELECT rowid AS id, -bm25({fts}) AS score "
+                f"FROM {fts} WHERE {fts} MATCH :q"
+            )
+            .bindparams(q=" ".join(f'"{t}"*' for t in terms))
+            .columns(id=Integer, score=Float)
+            .subquery()
+        )
+
+    # otros motores: sin índice de texto, mantenemos el comportamiento anterior
+    return (
+        select(model.id.label("id"), literal(0.0, Float).label("score"))
+        .where(*_like_conditions(columns, terms))
+        .subquery()
+    )
+
+
+def _like_conditions(columns, terms: List[str]):
+    """Cada término tiene que aparecer en alguna de las columnas."""
+    return [or_(*(col.ilike(f"%{t}%") for col in columns)) for t in terms]
+
+
+def search_page(
+    query,
+    model,
+    search: str,
+    *,
+    cursor: Optional[str],
+    skip: int,
+    limit: int,
+    response: Response,
+):
+    """
+    Filtra `query` (sobre `model`) por `search` y pagina los resultados por
+    relevancia, con el `id` como desempate. Un `search` sin términos no
+    devuelve nada.
+    """
+    matches = ranked_matches(query.session, model, search)
+    if matches is None:
+        # sin ningún término (`%`, `@@`): no casa nada, no es un listado sin filtro
+        return []
+
+    rows = keyset_paginate(
+        query.join(matches, matches.c.id == model.id).add_columns(matches.c.score),
+        matches.c.score,
+        model.id,
+        cursor=cursor,
+        skip=skip,
+        limit=limit,
+        response=response,
+        descending=True,
+        key=lambda row: (row.score, row[0].id),
+    )
+    return [row[0] for row in rows]
+
+
+if __name__ == "__main__":
+    from app.database import engine
+
+    install_search_indexes(engine)
+    print("Índices de búsqueda listos")
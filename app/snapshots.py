@@ -0,0 +1,139 @@
+"""
+Fotos diarias del pipeline (`pipeline_snapshots`) para las tendencias del
+dashboard.
+
+`pipeline_aggregates` solo sabe cómo está el pipeline ahora. Una vez al día
+este job copia el rollup (pocas filas por comercial/etapa/moneda) con el
+valor esperado ya calculado, así `/dashboard/trends` responde un rango de
+semanas leyendo unas cientos de filas en vez de reconstruir el histórico
+desde `deals`.
+
+    python -m app.snapshots                 # foto de hoy (UTC)
+    python -m app.snapshots --date 2026-10-17
+
+Repetirlo el mismo día sustituye la foto de ese día. Ojo: la foto siempre
+es del estado actual del rollup, la fecha solo es la etiqueta.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import DECIMAL, case, cast, delete, func, insert, literal, select
+
+from app import models
+from app.aggregates import STAGE_PROBABILITY, Aggregate
+
+Snapshot = models.PipelineSnapshot
+
+GRANULARITIES = ("day", "week")
+
+
+def take_pipeline_snapshot(db, day: Optional[date] = None) -> int:
+    """Guarda la foto del rollup con fecha `day` (hoy por defecto). Hace commit."""
+    day = day or datetime.utcnow().date()
+    probability = case(
+        *((Aggregate.stage == stage, prob) for stage, prob in STAGE_PROBABILITY.items()),
+        else_=0,
+    )
+    source = select(
+        literal(day, type_=Snapshot.snapshot_date.type),
+        Aggregate.owner_user_id,
+        Aggregate.stage,
+        Aggregate.currency,
+        Aggregate.deal_count,
+        Aggregate.total_amount,
+        cast(Aggregate.total_amount * probability, DECIMAL(16, 2)),
+    ).where(Aggregate.deal_count > 0)
+
+    db.execute(delete(Snapshot).where(Snapshot.snapshot_date == day))
+    result = db.execute(
+        insert(Snapshot).from_select(
+            [
+                "snapshot_date",
+                "owner_user_id",
+                "stage",
+                "currency",
+                "deal_count",
+                "total_amount",
+                "expected_amount",
+            ],
+            source,
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def pipeline_trends(
+    db,
+    from_date: date,
+    to_date: date,
+    owner_user_id: Optional[int] = None,
+    granularity: str = "day",
+) -> List[dict]:
+    """
+    Puntos {snapshot_date, stages: [{stage, count, total_amount, expected_value}]}
+    entre `from_date` y `to_date`, sumando comerciales y monedas.
+    Con `granularity="week"` cada semana (ISO) queda representada por su
+    última foto: son saldos, no se pueden sumar días.
+    """
+    query = db.query(
+        Snapshot.snapshot_date.label("snapshot_date"),
+        Snapshot.stage.label("stage"),
+        func.sum(Snapshot.deal_count).label("count"),
+        func.sum(Snapshot.total_amount).label("total_amount"),
+        func.sum(Snapshot.expected_amount).label("expected_value"),
+    ).filter(Snapshot.snapshot_date.between(from_date, to_date))
+
+    if owner_user_id:
+        query = query.filter(Snapshot.owner_user_id == owner_user_id)
+
+    rows = query.group_by(Snapshot.snapshot_date, Snapshot.stage).all()
+
+    by_date: Dict[date, list] = {}
+    for row in rows:
+        by_date.setdefault(row.snapshot_date, []).append(
+            {
+                "stage": row.stage,
+                "count": int(row.count or 0),
+                "total_amount": float(row.total_amount or 0),
+                "expected_value": float(row.expected_value or 0),
+            }
+        )
+
+    dates = sorted(by_date)
+    if granularity == "week":
+        last_of_week = {d.isocalendar()[:2]: d for d in dates}
+        dates = sorted(last_of_week.values())
+
+    stage_order = {stage: i for i, stage in enumerate(models.DEAL_STAGES)}
+    return [
+        {
+            "snapshot_date": d,
+            "stages": sorted(by_date[d], key=lambda s: stage_order.get(s["stage"], 99)),
+        }
+        for d in dates
+    ]
+
+
+def default_range(weeks: int = 8):
+    """Últimas `weeks` semanas hasta hoy (UTC)."""
+    today = datetime.utcnow().date()
+    return today - timedelta(weeks=weeks), today
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Foto diaria del pipeline")
+    parser.add_argument("--date", type=date.fromisoformat, default=None)
+    args = parser.parse_args()
+
+    Snapshot.__table__.create(engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        count = take_pipeline_snapshot(db, args.date)
+    finally:
+        db.close()
+    print(f"pipeline_snapshots: {count} filas")
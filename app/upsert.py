@@ -0,0 +1,156 @@
+"""
+Upsert por clave natural (`PUT /companies/upsert` por `name`,
+`PUT /contacts/upsert` por `email`) para la sincronización con el ERP.
+
+En vez de un GET + POST/PATCH por registro, el cliente manda el lote entero
+y por cada bloque de `UPSERT_CHUNK_SIZE` filas se hace:
+
+1. una query `WHERE key IN (...)` con las filas existentes, para clasificar
+   cada registro en insertado / actualizado / sin cambios (los que no
+   cambian no se escriben);
+2. un único `INSERT ... ON DUPLICATE KEY UPDATE` multi-fila (MySQL) o
+   `INSERT ... ON CONFLICT DO UPDATE` (SQLite) con los que sí cambian.
+   Si otro proceso inserta la misma clave entre 1 y 2, el upsert la
+   actualiza en vez de fallar.
+
+Solo se escriben los campos que trae cada registro (los omitidos no se
+ponen a NULL). Todo el lote va en una transacción, junto con las entradas
+del `change_log` de las filas escritas.
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app import schemas
+from app.changes import record_changes_from
+from app.models import utcnow
+
+UPSERT_CHUNK_SIZE = 500
+MAX_UPSERT_ROWS = 5000
+
+
+def upsert_rows(db, table, rows: List[dict], key: str) -> None:
+    """
+    INSERT de `rows` que actualiza las filas cuya `key` ya existe. Todas las
+    filas deben traer las mismas columnas. En MySQL/SQLite es una sola
+    sentencia multi-fila.
+    """
+    if not rows:
+        return
+    update_columns = [c for c in rows[0] if c not in (key, "created_at")]
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "mysql":
+        stmt = mysql.insert(table).values(rows)
+        db.execute(
+            stmt.on_duplicate_key_update(
+                {c: stmt.inserted[c] for c in update_columns}
+            )
+        )
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(table).values(rows)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[key],
+                set_={c: stmt.excluded[c] for c in update_columns},
+            )
+        )
+    else:
+        for values in rows:
+            result = db.execute(
+                update(table)
+                .where(table.c[key] == values[key])
+                .values({c: values[c] for c in update_columns})
+            )
+            if result.rowcount == 0:
+                db.execute(insert(table).values(**values))
+
+
+def _changed(existing, values: dict) -> bool:
+    return any(getattr(existing, field) != value for field, value in values.items())
+
+
+def _unique_items(items: Iterable[BaseModel], key: str) -> List[dict]:
+    """Campos enviados de cada registro; con claves repetidas gana el último."""
+    by_key: Dict[str, dict] = {}
+    for item in items:
+        values = item.dict(exclude_unset=True)
+        by_key[values[key].lower()] = values
+    return list(by_key.values())
+
+
+def upsert_by_key(
+    db,
+    model,
+    key: str,
+    items: List[BaseModel],
+    cache_tags: Callable[[Optional[object], dict], Iterable[Optional[str]]],
+) -> Tuple[schemas.UpsertReport, Set[str]]:
+    """
+    Upsert de `items` en `model` por la columna única `key`. Hace commit.
+    Devuelve el informe y las etiquetas de caché a invalidar:
+    `cache_tags(fila existente o None, valores)` de cada registro escrito.
+    """
+    if len(items) > MAX_UPSERT_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_UPSERT_ROWS} rows per request",
+        )
+
+    table = model.__table__
+    column = getattr(model, key)
+    rows = _unique_items(items, key)
+    report = schemas.UpsertReport(received=len(items))
+    tags: Set[str] = set()
+
+    try:
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            chunk = rows[start:start + UPSERT_CHUNK_SIZE]
+            # con la collation de MySQL el IN no distingue mayúsculas, igual
+            # que el índice único
+            existing = {
+                getattr(row, key).lower(): row
+                for row in db.query(model).filter(
+                    column.in_([values[key] for values in chunk])
+                )
+            }
+
+            now = utcnow()
+            # el INSERT multi-fila necesita las mismas columnas en todas las filas
+            groups: Dict[Tuple[str, ...], List[dict]] = {}
+            written: List[str] = []
+            for values in chunk:
+                current = existing.get(values[key].lower())
+                if current is None:
+                    report.inserted += 1
+                    tags.update(t for t in cache_tags(None, values) if t)
+                    values = {**values, "created_at": now, "updated_at": now}
+                elif _changed(current, values):
+                    report.updated += 1
+                    tags.update(t for t in cache_tags(current, values) if t)
+                    # la clave se escribe como ya está (puede variar en mayúsculas)
+                    values = {**values, key: getattr(current, key), "updated_at": now}
+                else:
+                    report.unchanged += 1
+                    continue
+                groups.setdefault(tuple(sorted(values)), []).append(values)
+                written.append(values[key])
+
+            for group in groups.values():
+                upsert_rows(db, table, group, key)
+            if written:
+                # el INSERT multi-fila no devuelve ids: se buscan por la clave
+                record_changes_from(db, model, column.in_(written))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid reference to a related record",
+        )
+
+    return report, tags
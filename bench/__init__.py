@@ -0,0 +1,12 @@
+"""
+Benchmarks reproducibles del CRM.
+
+- `python -m bench.seed`: llena la base de datos con un dataset sintético
+  (usuarios, compañías, contactos, deals y actividades) con reparto sesgado
+  por comercial, a la escala que se pida.
+- `python -m bench.run`: recorre los endpoints de todos los routers con un
+  cliente ASGI en proceso y reporta latencia p50/p95/p99 y queries por
+  request.
+
+Los dos funcionan contra SQLite o contra un MySQL local (`--url`).
+"""
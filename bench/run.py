@@ -0,0 +1,303 @@
+"""
+Harness de benchmark: recorre los endpoints de todos los routers con un
+cliente ASGI en proceso (sin red ni servidor) y reporta, por endpoint,
+latencia p50/p95/p99 y queries SQL por request (leídas de la cabecera
+`Server-Timing` que pone `SQLTimingMiddleware`).
+
+    python -m bench.seed --url sqlite:///bench.db --scale small --create
+    python -m bench.run --url sqlite:///bench.db --requests 200 --concurrency 8
+    python -m bench.run --url sqlite:///bench.db --only deals --json before.json
+
+Por defecto la caché de respuestas está desactivada para medir el coste
+real de cada endpoint (`--cache` para activarla). Los escenarios de
+escritura crean sus propias filas y las borran al terminar.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+QUERIES_RE = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: Callable[[random.Random], str]
+    params: Callable[[random.Random], dict] = lambda rng: {}
+    body: Optional[Callable[[random.Random], object]] = None
+    content_type: Optional[str] = None
+    write: bool = False
+
+
+@dataclass
+class Result:
+    latencies: List[float] = field(default_factory=list)
+    queries: List[int] = field(default_factory=list)
+    errors: int = 0
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def _configure_env(args) -> None:
+    """La app lee la configuración del entorno al importarse."""
+    os.environ["CRM_DATABASE_URL"] = args.url
+    # el SQL en consola distorsiona las medidas
+    os.environ["CRM_DB_ECHO"] = "0"
+    os.environ["CRM_SQL_TIMING_SAMPLE_RATE"] = "1"
+    os.environ["CRM_SQL_TIMING_ROUTE_RATES"] = ""
+    if not args.cache:
+        os.environ["CRM_CACHE_TTL_SECONDS"] = "0"
+    if args.use_async:
+        os.environ["CRM_DB_ASYNC"] = "1"
+        os.environ["CRM_ASYNC_DATABASE_URL"] = (
+            args.url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+            .replace("mysql+mysqlconnector://", "mysql+aiomysql://", 1)
+        )
+
+
+def _sample_ids(engine, model, limit=500) -> List[int]:
+    from sqlalchemy import func, select
+
+    with engine.connect() as conn:
+        max_id = conn.scalar(select(func.max(model.id))) or 0
+    if not max_id:
+        return []
+    rng = random.Random(7)
+    return [rng.randint(1, max_id) for _ in range(limit)]
+
+
+def build_scenarios(ids: Dict[str, List[int]]) -> List[Scenario]:
+    def pick(kind):
+        return lambda rng: rng.choice(ids[kind] or [1])
+
+    company, contact, deal, activity, user = (
+        pick("company"), pick("contact"), pick("deal"), pick("activity"), pick("user"),
+    )
+    # en UTC, como las fechas que guarda la app y genera bench/seed.py
+    now = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
+    month_ahead = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(time.time() + 31 * 86400))
+
+    def batch(kind, size=200):
+        return lambda rng: {"ids": ",".join(str(rng.choice(ids[kind] or [1])) for _ in range(size))}
+
+    def csv_contacts(rng):
+        n = rng.randrange(10**9)
+        return "first_name,last_name,email\n" + "".join(
+            f"Bench,Import,bench.import.{n}.{i}@example.com\n" for i in range(50)
+        )
+
+    return [
+        # ---- deals
+        Scenario("deals.list", "GET", lambda r: "/deals/", lambda r: {"limit": 50}),
+        Scenario("deals.list_500", "GET", lambda r: "/deals/", lambda r: {"limit": 500}),
+        Scenario("deals.list_fields", "GET", lambda r: "/deals/", lambda r: {"limit": 50, "fields": "title,amount,stage"}),
+        Scenario("deals.list_owner", "GET", lambda r: "/deals/", lambda r: {"owner_user_id": user(r), "limit": 50}),
+        Scenario("deals.list_deep_skip", "GET", lambda r: "/deals/", lambda r: {"skip": 5000, "limit": 50}),
+        Scenario("deals.get", "GET", lambda r: f"/deals/{deal(r)}"),
+        Scenario("deals.batch", "GET", lambda r: "/deals/batch", batch("deal")),
+        Scenario("deals.activities", "GET", lambda r: f"/deals/{deal(r)}/activities"),
+        Scenario("deals.export", "GET", lambda r: "/deals/export", lambda r: {"owner_user_id": user(r), "format": "ndjson"}),
+        Scenario("deals.create", "POST", lambda r: "/deals/", body=lambda r: {"title": "bench", "company_id": company(r), "amount": 100}, write=True),
+        Scenario("deals.update", "PATCH", lambda r: f"/deals/{deal(r)}", body=lambda r: {"close_date": "2030-01-01"}, write=True),
+        Scenario("deals.stage", "PATCH", lambda r: f"/deals/{deal(r)}/stage", lambda r: {"stage": r.choice(["qualified", "proposal"])}, write=True),
+        Scenario("deals.stage_bulk", "PATCH", lambda r: "/deals/stage", body=lambda r: {"ids": [deal(r) for _ in range(50)], "stage": r.choice(["qualified", "proposal"])}, write=True),
+        # ---- contacts
+        Scenario("contacts.list", "GET", lambda r: "/contacts/", lambda r: {"limit": 50}),
+        Scenario("contacts.search", "GET", lambda r: "/contacts/", lambda r: {"search": r.choice(["ana", "garcía", "luis p", "maría"])}),
+        Scenario("contacts.get", "GET", lambda r: f"/contacts/{contact(r)}"),
+        Scenario("contacts.batch", "GET", lambda r: "/contacts/batch", batch("contact")),
+        Scenario("contacts.detail", "GET", lambda r: f"/contacts/{contact(r)}/detail"),
+        Scenario("contacts.export", "GET", lambda r: "/contacts/export", lambda r: {"company_id": company(r)}),
+        Scenario("contacts.create", "POST", lambda r: "/contacts/", body=lambda r: {"first_name": "Bench", "last_name": "Create", "email": f"bench.create.{uuid.uuid4().hex}@example.com", "company_id": company(r)}, write=True),
+        Scenario("contacts.import", "POST", lambda r: "/contacts/import", body=csv_contacts, content_type="text/csv", write=True),
+        Scenario("contacts.update", "PATCH", lambda r: f"/contacts/{contact(r)}", body=lambda r: {"position": "Bench"}, write=True),
+        # ---- companies
+        Scenario("companies.list", "GET", lambda r: "/companies/", lambda r: {"limit": 50}),
+        Scenario("companies.search", "GET", lambda r: "/companies/", lambda r: {"search": r.choice(["garcía", "madrid", "software"])}),
+        Scenario("companies.get", "GET", lambda r: f"/companies/{company(r)}"),
+        Scenario("companies.batch", "GET", lambda r: "/companies/batch", batch("company")),
+        Scenario("companies.detail", "GET", lambda r: f"/companies/{company(r)}/detail"),
+        Scenario("companies.create", "POST", lambda r: "/companies/", body=lambda r: {"name": f"Bench Create {uuid.uuid4().hex}", "industry": "Bench"}, write=True),
+        Scenario("companies.update", "PATCH", lambda r: f"/companies/{company(r)}", body=lambda r: {"phone": "600000000"}, write=True),
+        # ---- activities
+        Scenario("activities.list", "GET", lambda r: "/activities/", lambda r: {"limit": 50}),
+        Scenario("activities.list_500", "GET", lambda r: "/activities/", lambda r: {"limit": 500}),
+        Scenario("activities.list_fields", "GET", lambda r: "/activities/", lambda r: {"limit": 50, "fields": "subject,due_date,done"}),
+        Scenario("activities.list_owner_range", "GET", lambda r: "/activities/", lambda r: {"owner_user_id": user(r), "due_from": now, "limit": 50}),
+        Scenario("activities.calendar", "GET", lambda r: "/activities/calendar", lambda r: {"owner_user_id": user(r), "due_from": now, "due_to": month_ahead}),
+        Scenario("activities.get", "GET", lambda r: f"/activities/{activity(r)}"),
+        Scenario("activities.batch", "GET", lambda r: "/activities/batch", batch("activity")),
+        Scenario("activities.export", "GET", lambda r: "/activities/export", lambda r: {"deal_id": deal(r)}),
+        Scenario("activities.create", "POST", lambda r: "/activities/", body=lambda r: {"type": "call", "subject": "bench", "deal_id": deal(r)}, write=True),
+        Scenario("activities.update", "PATCH", lambda r: f"/activities/{activity(r)}", body=lambda r: {"done": True}, write=True),
+        # ---- dashboard
+        Scenario("dashboard.summary", "GET", lambda r: "/dashboard/summary"),
+        Scenario("dashboard.summary_owner", "GET", lambda r: "/dashboard/summary", lambda r: {"owner_user_id": user(r)}),
+    ]
+
+
+async def _run_scenario(client, scenario: Scenario, requests: int, concurrency: int, seed: int) -> Result:
+    result = Result()
+    rng = random.Random(seed)
+    calls = [
+        (
+            scenario.path(rng),
+            scenario.params(rng),
+            scenario.body(rng) if scenario.body else None,
+        )
+        for _ in range(requests)
+    ]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(path, params, body):
+        kwargs = {"params": params}
+        if isinstance(body, str):
+            kwargs["content"] = body.encode()
+            kwargs["headers"] = {"content-type": scenario.content_type}
+        elif body is not None:
+            kwargs["json"] = body
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.request(scenario.method, path, **kwargs)
+            await response.aread()
+            elapsed = time.perf_counter() - start
+        if response.status_code >= 400 and response.status_code != 404:
+            result.errors += 1
+            return
+        result.latencies.append(elapsed)
+        match = QUERIES_RE.search(response.headers.get("server-timing", ""))
+        if match:
+            result.queries.append(int(match.group(1)))
+
+    await asyncio.gather(*(one(*call) for call in calls))
+    return result
+
+
+def _cleanup(engine, started_at_ids: Dict[str, int]) -> None:
+    """Borra las filas creadas por los escenarios de escritura."""
+    from sqlalchemy import delete
+
+    from app import models
+    from app.aggregates import rebuild_pipeline_aggregates
+    from sqlalchemy.orm import Session
+
+    with Session(engine) as db:
+        db.execute(delete(models.Activity).where(models.Activity.id > started_at_ids["activity"]))
+        db.execute(delete(models.Deal).where(models.Deal.id > started_at_ids["deal"]))
+        db.execute(delete(models.Contact).where(models.Contact.id > started_at_ids["contact"]))
+        db.execute(delete(models.Company).where(models.Company.id > started_at_ids["company"]))
+        db.commit()
+        rebuild_pipeline_aggregates(db)
+
+
+async def run(args) -> Dict[str, dict]:
+    import httpx
+    from sqlalchemy import func, select
+
+    from app import database, models
+    from app.main import app
+
+    engine = database.engine
+    ids = {
+        "company": _sample_ids(engine, models.Company),
+        "contact": _sample_ids(engine, models.Contact),
+        "deal": _sample_ids(engine, models.Deal),
+        "activity": _sample_ids(engine, models.Activity),
+        "user": _sample_ids(engine, models.User, limit=50),
+    }
+    with engine.connect() as conn:
+        max_ids = {
+            "activity": conn.scalar(select(func.coalesce(func.max(models.Activity.id), 0))),
+            "deal": conn.scalar(select(func.coalesce(func.max(models.Deal.id), 0))),
+            "contact": conn.scalar(select(func.coalesce(func.max(models.Contact.id), 0))),
+            "company": conn.scalar(select(func.coalesce(func.max(models.Company.id), 0))),
+        }
+
+    scenarios = build_scenarios(ids)
+    if args.only:
+        scenarios = [s for s in scenarios if any(s.name.startswith(o) for o in args.only)]
+    if args.no_writes:
+        scenarios = [s for s in scenarios if not s.write]
+
+    report = {}
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for scenario in scenarios:
+                # calentamiento: plan de queries, pool de conexiones, imports
+                await _run_scenario(client, scenario, min(5, args.requests), 1, args.seed)
+                start = time.perf_counter()
+                result = await _run_scenario(client, scenario, args.requests, args.concurrency, args.seed)
+                wall = time.perf_counter() - start
+                report[scenario.name] = {
+                    "requests": len(result.latencies),
+                    "errors": result.errors,
+                    "p50_ms": percentile(result.latencies, 50) * 1000,
+                    "p95_ms": percentile(result.latencies, 95) * 1000,
+                    "p99_ms": percentile(result.latencies, 99) * 1000,
+                    "rps": len(result.latencies) / wall if wall else 0.0,
+                    "queries_avg": (sum(result.queries) / len(result.queries)) if result.queries else None,
+                    "queries_max": max(result.queries) if result.queries else None,
+                }
+                _print_row(scenario.name, report[scenario.name])
+    finally:
+        if any(s.write for s in scenarios):
+            _cleanup(engine, max_ids)
+    return report
+
+
+def _print_header() -> None:
+    print(f"{'endpoint':<30}{'req':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rps':>8}{'q/req':>7}{'q max':>7}")
+    print("-" * 90)
+
+
+def _print_row(name: str, row: dict) -> None:
+    q_avg = "-" if row["queries_avg"] is None else f"{row['queries_avg']:.1f}"
+    q_max = "-" if row["queries_max"] is None else str(row["queries_max"])
+    print(
+        f"{name:<30}{row['requests']:>6}{row['errors']:>5}"
+        f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+        f"{row['rps']:>8.0f}{q_avg:>7}{q_max:>7}"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de endpoints del CRM")
+    parser.add_argument("--url", required=True, help="DSN de la base de datos sembrada con bench.seed")
+    parser.add_argument("--requests", type=int, default=100, help="requests por endpoint")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", nargs="*", help="prefijos de escenario (deals, contacts.search, ...)")
+    parser.add_argument("--no-writes", action="store_true", help="solo endpoints de lectura")
+    parser.add_argument("--cache", action="store_true", help="activar la caché de respuestas")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="modo CRM_DB_ASYNC")
+    parser.add_argument("--json", help="guardar el resultado en este fichero")
+    args = parser.parse_args(argv)
+
+    _configure_env(args)
+    _print_header()
+    report = asyncio.run(run(args))
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({"args": vars(args), "results": report}, fh, indent=2)
+        print(f"\nResultados en {args.json}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Microbenchmark de los listados sin HTTP: carga de una página + serialización.
+
+Compara, para `list_deals` y `list_activities` con las mismas filas:
+
+- `pydantic`: lo que hacían los listados antes: objetos ORM con sus
+  relaciones cargadas, un `DealOut(...)` por fila y después la validación +
+  serialización contra `List[DealOut]` que hace FastAPI con el
+  `response_model`.
+- `fast`: el camino actual: filas planas con solo las columnas de la
+  respuesta, dicts y `app.responses.dumps` (orjson si está instalado).
+
+    python -m bench.serialization --url sqlite:///bench.db --rows 500
+"""
+import argparse
+import os
+import time
+from typing import List
+
+
+def _time(fn, repeat: int) -> float:
+    fn()  # calentamiento
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de serialización de listados")
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    os.environ["CRM_DATABASE_URL"] = args.url
+    os.environ["CRM_DB_ECHO"] = "0"
+
+    from pydantic import TypeAdapter
+
+    from app import database, models, responses, schemas
+    from app.routers import activities, deals
+
+    Deal, Activity = models.Deal, models.Activity
+    deal_order = (Deal.created_at.desc(), Deal.id.desc())
+    activity_order = (Activity.due_date, Activity.id)
+
+    cases = [
+        (
+            "list_deals",
+            schemas.DealOut,
+            lambda db: deals._enriched_query(db).order_by(*deal_order),
+            deals.deal_to_out,
+            lambda db: deals._list_query(db, deals.DEAL_FIELDS).order_by(*deal_order),
+            deals.DEAL_FIELDS,
+            deals.DEAL_ENRICHED,
+        ),
+        (
+            "list_activities",
+            schemas.ActivityOut,
+            lambda db: activities.enriched_query(db).order_by(*activity_order),
+            activities.activity_to_out,
+            lambda db: activities._list_query(db, activities.ACTIVITY_FIELDS).order_by(*activity_order),
+            activities.ACTIVITY_FIELDS,
+            activities.ACTIVITY_ENRICHED,
+        ),
+    ]
+
+    json_lib = "orjson" if responses.orjson is not None else "json"
+    print(f"{'endpoint':<18}{'filas':>7}{'pydantic ms':>13}{'fast ms':>10}{'x':>7}   ({json_lib})")
+    for name, schema, orm_query, to_out, rows_query, fields, enriched in cases:
+        adapter = TypeAdapter(List[schema])
+
+        def pydantic_path():
+            with database.SessionLocal() as db:
+                objs = [to_out(r) for r in orm_query(db).limit(args.rows)]
+                adapter.dump_json(adapter.validate_python(objs, from_attributes=True))
+
+        def fast_path():
+            with database.SessionLocal() as db:
+                rows = rows_query(db).limit(args.rows).all()
+                responses.dumps(responses.row_dicts(rows, fields, enriched))
+
+        slow = _time(pydantic_path, args.repeat)
+        fast = _time(fast_path, args.repeat)
+        print(
+            f"{name:<18}{args.rows:>7}{slow * 1000:>13.2f}{fast * 1000:>10.2f}"
+            f"{slow / fast if fast else 0:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Entorno de Alembic: la URL sale de app/config.py y el esquema de referencia
+(para `alembic revision --autogenerate`) es `Base.metadata` de app/models.py.
+"""
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, pool
+
+from app import models  # noqa: F401  (registra las tablas en Base.metadata)
+from app.config import DATABASE_URL
+from app.database import Base, utc_sessions
+from app.search import SEARCH_COLUMNS, _fts_table, _mysql_index_name
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+# objetos de búsqueda que no están en los modelos (los crea la migración 0002)
+SEARCH_OBJECTS = {_mysql_index_name(t) for t in SEARCH_COLUMNS} | {
+    f"{_fts_table(t)}{suffix}"
+    for t in SEARCH_COLUMNS
+    for suffix in ("", "_data", "_idx", "_docsize", "_config", "_content")
+}
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    if reflected and compare_to is None and name in SEARCH_OBJECTS:
+        return False
+    return True
+
+
+def run_migrations_offline() -> None:
+    """`alembic upgrade head --sql`: genera el SQL sin conectarse."""
+    context.configure(
+        url=DATABASE_URL,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    # los server_default (CURRENT_TIMESTAMP) de las migraciones, en UTC
+    connectable = utc_sessions(create_engine(DATABASE_URL, poolclass=pool.NullPool))
+    with connectable.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+            # SQLite no soporta casi ningún ALTER: recrea la tabla
+            render_as_batch=connection.dialect.name == "sqlite",
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,99 @@
+"""
+Utilidades compartidas por las migraciones.
+
+Crear un índice en MySQL con `op.create_index` hace un `CREATE INDEX` normal,
+que en tablas grandes (millones de deals/actividades) puede bloquear las
+escrituras mientras se construye. `create_index_online` usa el DDL online
+de InnoDB (`ALGORITHM=INPLACE, LOCK=NONE`): las escrituras siguen durante
+la construcción y, si el servidor no puede hacerlo sin bloquear, MySQL
+falla en vez de bloquear en silencio. `lock_wait_timeout` corto evita que
+el ALTER se quede esperando el metadata lock detrás de una transacción
+larga y bloquee a todas las queries que vengan detrás.
+
+Los índices FULLTEXT son la excepción: InnoDB no admite `LOCK=NONE` al
+añadirlos (el primero de la tabla además la reconstruye entera para añadir
+`FTS_DOC_ID`), así que `create_fulltext_index` BLOQUEA las escrituras en la
+tabla mientras dura la construcción (`LOCK=SHARED`: las lecturas siguen).
+En tablas grandes no hay que lanzarlo con tráfico: o en una ventana de
+mantenimiento, o con pt-online-schema-change / gh-ost, que construyen una
+copia de la tabla y la cambian al final sin bloquear.
+
+Todas son idempotentes, para poder aplicarlas sobre bases de datos creadas
+con `create_all` (que ya tienen los índices de los modelos).
+"""
+from typing import List
+
+from alembic import context, op
+import sqlalchemy as sa
+
+# segundos que el ALTER espera el metadata lock antes de rendirse
+LOCK_WAIT_TIMEOUT = 5
+
+
+def offline() -> bool:
+    return context.is_offline_mode()
+
+
+def dialect_name() -> str:
+    return context.get_context().dialect.name
+
+
+def has_table(table: str) -> bool:
+    if offline():
+        return False
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def has_column(table: str, column: str) -> bool:
+    if offline():
+        return False
+    return any(
+        col["name"] == column for col in sa.inspect(op.get_bind()).get_columns(table)
+    )
+
+
+def has_index(table: str, name: str) -> bool:
+    if offline():
+        return False
+    return any(
+        ix["name"] == name for ix in sa.inspect(op.get_bind()).get_indexes(table)
+    )
+
+
+def create_index_online(name: str, table: str, columns: List[str]) -> None:
+    if has_index(table, name):
+        return
+    if dialect_name() == "mysql":
+        op.execute(f"SET SESSION lock_wait_timeout = {LOCK_WAIT_TIMEOUT}")
+        op.execute(
+            f"CREATE INDEX {name} ON {table} ({', '.join(columns)}) "
+            "ALGORITHM=INPLACE LOCK=NONE"
+        )
+    else:
+        op.create_index(name, table, columns)
+
+
+def drop_index_online(name: str, table: str) -> None:
+    if not offline() and not has_index(table, name):
+        return
+    if dialect_name() == "mysql":
+        op.execute(f"SET SESSION lock_wait_timeout = {LOCK_WAIT_TIMEOUT}")
+        op.execute(f"DROP INDEX {name} ON {table} ALGORITHM=INPLACE LOCK=NONE")
+    else:
+        op.drop_index(name, table_name=table)
+
+
+def create_fulltext_index(name: str, table: str, columns: List[str]) -> None:
+    """
+    Índice FULLTEXT de MySQL (mismo DDL que app/search.py). Bloquea las
+    escrituras en `table` mientras se construye: ver el docstring del módulo.
+    Sin stopwords, para que se indexen palabras como `com` o `de`.
+    """
+    if has_index(table, name):
+        return
+    op.execute(f"SET SESSION lock_wait_timeout = {LOCK_WAIT_TIMEOUT}")
+    op.execute("SET SESSION innodb_ft_enable_stopword = OFF")
+    op.execute(
+        f"ALTER TABLE {table} ADD FULLTEXT INDEX {name} ({', '.join(columns)}), "
+        "ALGORITHM=INPLACE, LOCK=SHARED"
+    )
@@ -0,0 +1,136 @@
+"""esquema inicial: users, companies, contacts, deals, activities
+
+Es el esquema que creaba `Base.metadata.create_all` antes de usar Alembic.
+Una base de datos que ya lo tenga se marca con `alembic stamp 0001`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.models import BigIntPK, Timestamp
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _timestamps(updated=True):
+    columns = [
+        sa.Column(
+            "created_at",
+            Timestamp,
+            server_default=sa.func.current_timestamp(),
+            nullable=False,
+        )
+    ]
+    if updated:
+        columns.append(
+            sa.Column(
+                "updated_at",
+                Timestamp,
+                server_default=sa.func.current_timestamp(),
+                nullable=False,
+            )
+        )
+    return columns
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", BigIntPK, primary_key=True, autoincrement=True),
+        sa.Column("name", sa.String(120), nullable=False),
+        sa.Column("email", sa.String(160), nullable=False),
+        sa.Column("hashed_password", sa.String(255), nullable=False),
+        sa.Column(
+            "role",
+            sa.Enum("admin", "seller", "viewer", name="role_enum"),
+            nullable=False,
+        ),
+        sa.Column("created_at", Timestamp, server_default=sa.func.current_timestamp()),
+        sa.Column("last_login", Timestamp, nullable=True),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "companies",
+        sa.Column("id", BigIntPK, primary_key=True, autoincrement=True),
+        sa.Column("name", sa.String(180), nullable=False),
+        sa.Column("industry", sa.String(120)),
+        sa.Column("website", sa.String(200)),
+        sa.Column("phone", sa.String(40)),
+        sa.Column("country", sa.String(80)),
+        sa.Column("city", sa.String(80)),
+        sa.Column("address", sa.String(200)),
+        sa.Column("owner_user_id", sa.BigInteger, sa.ForeignKey("users.id")),
+        *_timestamps(),
+    )
+    op.create_index("ix_companies_id", "companies", ["id"])
+    op.create_index("ix_companies_name", "companies", ["name"], unique=True)
+
+    op.create_table(
+        "contacts",
+        sa.Column("id", BigIntPK, primary_key=True, autoincrement=True),
+        sa.Column("first_name", sa.String(100), nullable=False),
+        sa.Column("last_name", sa.String(100), nullable=False),
+        sa.Column("email", sa.String(160)),
+        sa.Column("phone", sa.String(40)),
+        sa.Column("position", sa.String(120)),
+        sa.Column("company_id", sa.BigInteger, sa.ForeignKey("companies.id")),
+        sa.Column("owner_user_id", sa.BigInteger, sa.ForeignKey("users.id")),
+        sa.Column("tags", sa.JSON),
+        *_timestamps(),
+    )
+    op.create_index("ix_contacts_id", "contacts", ["id"])
+    op.create_index("ix_contacts_email", "contacts", ["email"], unique=True)
+
+    op.create_table(
+        "deals",
+        sa.Column("id", BigIntPK, primary_key=True, autoincrement=True),
+        sa.Column("title", sa.String(200), nullable=False),
+        sa.Column("amount", sa.DECIMAL(12, 2), nullable=False),
+        sa.Column("currency", sa.CHAR(3), nullable=False),
+        sa.Column(
+            "stage",
+            sa.Enum(
+                "prospecting", "qualified", "proposal", "won", "lost",
+                name="deal_stage_enum",
+            ),
+            nullable=False,
+        ),
+        sa.Column("close_date", sa.Date),
+        sa.Column("company_id", sa.BigInteger, sa.ForeignKey("companies.id"), nullable=False),
+        sa.Column("contact_id", sa.BigInteger, sa.ForeignKey("contacts.id")),
+        sa.Column("owner_user_id", sa.BigInteger, sa.ForeignKey("users.id")),
+        *_timestamps(),
+    )
+    op.create_index("ix_deals_id", "deals", ["id"])
+
+    op.create_table(
+        "activities",
+        sa.Column("id", BigIntPK, primary_key=True, autoincrement=True),
+        sa.Column(
+            "type",
+            sa.Enum("call", "email", "meeting", "task", name="activity_type_enum"),
+            nullable=False,
+        ),
+        sa.Column("subject", sa.String(200), nullable=False),
+        sa.Column("notes", sa.Text),
+        sa.Column("due_date", sa.DateTime),
+        sa.Column("done", sa.Boolean, nullable=False),
+        sa.Column("deal_id", sa.BigInteger, sa.ForeignKey("deals.id")),
+        sa.Column("contact_id", sa.BigInteger, sa.ForeignKey("contacts.id")),
+        sa.Column("owner_user_id", sa.BigInteger, sa.ForeignKey("users.id")),
+        *_timestamps(updated=False),
+    )
+    op.create_index("ix_activities_id", "activities", ["id"])
+
+
+def downgrade() -> None:
+    for table in ("activities", "deals", "contacts", "companies", "users"):
+        op.drop_table(table)
@@ -0,0 +1,75 @@
+"""índices de búsqueda (FULLTEXT / FTS5) y tabla pipeline_aggregates
+
+Idempotente: las bases de datos creadas con `create_all` ya tienen estos
+objetos y la migración solo los crea si faltan. Con `--sql` el rollup no
+se rellena: hay que ejecutar después `python -m app.aggregates`.
+
+⚠ En MySQL los índices FULLTEXT NO se crean online: el ALTER lleva
+`ALGORITHM=INPLACE, LOCK=SHARED` y bloquea las escrituras en `contacts` y
+`companies` mientras se construye (el primer FULLTEXT reconstruye la tabla).
+Con tablas grandes, aplicar en una ventana de mantenimiento o crear los
+índices antes con pt-online-schema-change / gh-ost (la migración se salta
+los que ya existen). Ver migrations/helpers.py.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.aggregates import rebuild_pipeline_aggregates
+from app.search import (
+    SEARCH_COLUMNS,
+    _mysql_index_name,
+    _sqlite_ddl,
+    create_search_indexes,
+    drop_search_indexes,
+)
+from migrations.helpers import create_fulltext_index, dialect_name, has_table, offline
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if dialect_name() == "mysql":
+        for table, columns in SEARCH_COLUMNS.items():
+            create_fulltext_index(_mysql_index_name(table), table, list(columns))
+    elif offline():
+        # --sql: no podemos consultar qué existe ya, se emite el DDL tal cual
+        if dialect_name() == "sqlite":
+            for table in SEARCH_COLUMNS:
+                for stmt in _sqlite_ddl(table):
+                    op.execute(stmt)
+    else:
+        create_search_indexes(op.get_bind())
+
+    if not has_table("pipeline_aggregates"):
+        op.create_table(
+            "pipeline_aggregates",
+            sa.Column("owner_user_id", sa.BigInteger, primary_key=True, autoincrement=False),
+            sa.Column(
+                "stage",
+                sa.Enum(
+                    "prospecting", "qualified", "proposal", "won", "lost",
+                    name="deal_stage_enum",
+                ),
+                primary_key=True,
+            ),
+            sa.Column("currency", sa.CHAR(3), primary_key=True),
+            sa.Column("deal_count", sa.BigInteger, nullable=False),
+            sa.Column("total_amount", sa.DECIMAL(16, 2), nullable=False),
+        )
+
+    if not offline():
+        # rellena el rollup con los deals existentes
+        rebuild_pipeline_aggregates(Session(bind=op.get_bind()))
+
+
+def downgrade() -> None:
+    op.drop_table("pipeline_aggregates")
+    drop_search_indexes(op.get_bind())
@@ -0,0 +1,52 @@
+"""índices compuestos para los filtros + orden de los listados
+
+Cada listado pagina por cursor con `ORDER BY <col>, id`; con un índice
+(filtro, col, id) la página se lee directamente del índice en orden, sin
+filesort ni recorrer la tabla:
+
+- deals:      created_at DESC, id DESC  (+ owner_user_id / company_id / stage)
+- contacts:   created_at DESC, id DESC  (+ company_id)
+- companies:  created_at DESC, id DESC
+- activities: due_date, id              (+ owner_user_id / deal_id / contact_id);
+              también las próximas actividades del dashboard y el detalle
+              de deal/contacto
+- deals (owner_user_id, stage, currency, amount): cubre el GROUP BY que
+  recalcula pipeline_aggregates
+
+En MySQL se crean online (ver migrations/helpers.py).
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from migrations.helpers import create_index_online, drop_index_online
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_companies_created_at_id", "companies", ["created_at", "id"]),
+    ("ix_contacts_created_at_id", "contacts", ["created_at", "id"]),
+    ("ix_contacts_company_created_at", "contacts", ["company_id", "created_at", "id"]),
+    ("ix_deals_created_at_id", "deals", ["created_at", "id"]),
+    ("ix_deals_owner_created_at", "deals", ["owner_user_id", "created_at", "id"]),
+    ("ix_deals_company_created_at", "deals", ["company_id", "created_at", "id"]),
+    ("ix_deals_stage_created_at", "deals", ["stage", "created_at", "id"]),
+    ("ix_deals_owner_stage", "deals", ["owner_user_id", "stage", "currency", "amount"]),
+    ("ix_activities_due_date_id", "activities", ["due_date", "id"]),
+    ("ix_activities_owner_due_date", "activities", ["owner_user_id", "due_date", "id"]),
+    ("ix_activities_deal_due_date", "activities", ["deal_id", "due_date", "id"]),
+    ("ix_activities_contact_due_date", "activities", ["contact_id", "due_date", "id"]),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        create_index_online(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        drop_index_online(name, table)
@@ -0,0 +1,50 @@
+"""tabla pipeline_snapshots (fotos diarias del pipeline)
+
+La rellena `python -m app.snapshots` una vez al día; la migración solo crea
+la tabla (el histórico empieza el día que se empiece a ejecutar el job).
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_table
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if has_table("pipeline_snapshots"):
+        return
+    op.create_table(
+        "pipeline_snapshots",
+        sa.Column("snapshot_date", sa.Date, primary_key=True),
+        sa.Column("owner_user_id", sa.BigInteger, primary_key=True, autoincrement=False),
+        sa.Column(
+            "stage",
+            sa.Enum(
+                "prospecting", "qualified", "proposal", "won", "lost",
+                name="deal_stage_enum",
+            ),
+            primary_key=True,
+        ),
+        sa.Column("currency", sa.CHAR(3), primary_key=True),
+        sa.Column("deal_count", sa.BigInteger, nullable=False),
+        sa.Column("total_amount", sa.DECIMAL(16, 2), nullable=False),
+        sa.Column("expected_amount", sa.DECIMAL(16, 2), nullable=False),
+    )
+    op.create_index(
+        "ix_pipeline_snapshots_owner_date",
+        "pipeline_snapshots",
+        ["owner_user_id", "snapshot_date"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_pipeline_snapshots_owner_date", table_name="pipeline_snapshots")
+    op.drop_table("pipeline_snapshots")
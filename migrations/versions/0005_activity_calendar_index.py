@@ -0,0 +1,27 @@
+"""índice de cobertura para /activities/calendar
+
+(owner_user_id, due_date, type, done): el rango de fechas de un comercial
+se lee solo del índice y el GROUP BY por día/hora, tipo y done no toca la
+tabla (ni los `notes`). En MySQL se crea online (ver migrations/helpers.py).
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from migrations.helpers import create_index_online, drop_index_online
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+NAME = "ix_activities_owner_due_type_done"
+COLUMNS = ["owner_user_id", "due_date", "type", "done"]
+
+
+def upgrade() -> None:
+    create_index_online(NAME, "activities", COLUMNS)
+
+
+def downgrade() -> None:
+    drop_index_online(NAME, "activities")
@@ -0,0 +1,72 @@
+"""change_log (feed GET /changes) y activities.updated_at
+
+`activities.updated_at` entra con DEFAULT CURRENT_TIMESTAMP: las filas que
+ya existen quedan con la fecha de la migración en vez de reescribir la
+tabla entera para copiar `created_at` (en MySQL 8 el ADD COLUMN es INSTANT).
+En SQLite hay que recrear la tabla, porque ADD COLUMN no admite un default
+no constante.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.models import BigIntPK, Timestamp
+from migrations.helpers import dialect_name, has_column, has_table
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if not has_column("activities", "updated_at"):
+        column = sa.Column(
+            "updated_at",
+            Timestamp,
+            server_default=sa.func.current_timestamp(),
+            nullable=False,
+        )
+        if dialect_name() == "sqlite":
+            with op.batch_alter_table("activities", recreate="always") as batch:
+                batch.add_column(column)
+        else:
+            op.add_column("activities", column)
+
+    if not has_table("change_log"):
+        op.create_table(
+            "change_log",
+            sa.Column("id", BigIntPK, primary_key=True, autoincrement=True),
+            sa.Column(
+                "entity",
+                sa.Enum(
+                    "company", "contact", "deal", "activity",
+                    name="change_entity_enum",
+                ),
+                nullable=False,
+            ),
+            sa.Column("entity_id", sa.BigInteger, nullable=False),
+            sa.Column(
+                "op",
+                sa.Enum("upsert", "delete", name="change_op_enum"),
+                nullable=False,
+            ),
+            sa.Column(
+                "changed_at",
+                Timestamp,
+                server_default=sa.func.current_timestamp(),
+                nullable=False,
+            ),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("change_log")
+    if dialect_name() == "sqlite":
+        with op.batch_alter_table("activities", recreate="always") as batch:
+            batch.drop_column("updated_at")
+    else:
+        op.drop_column("activities", "updated_at")
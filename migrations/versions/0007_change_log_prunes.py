@@ -0,0 +1,40 @@
+"""change_log_prunes: hasta qué id ha borrado la limpieza del change_log
+
+`GET /changes` comparaba el token con el id más bajo que queda en el log,
+lo que da 410 a tokens válidos cuando hay huecos en los ids (rollbacks,
+`auto_increment_increment`). Ahora cada limpieza deja aquí el último id
+borrado y solo caduca un token menor que ese.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.models import BigIntPK, Timestamp
+from migrations.helpers import has_table
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if not has_table("change_log_prunes"):
+        op.create_table(
+            "change_log_prunes",
+            sa.Column("id", BigIntPK, primary_key=True, autoincrement=True),
+            sa.Column("pruned_through", sa.BigInteger, nullable=False),
+            sa.Column(
+                "pruned_at",
+                Timestamp,
+                server_default=sa.func.current_timestamp(),
+                nullable=False,
+            ),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("change_log_prunes")
@@ -0,0 +1,11 @@
+"""
+Configuración común de los tests: base de datos SQLite temporal. Las
+variables de entorno tienen que estar puestas antes de importar `app`
+(app/config.py las lee al importarse).
+"""
+import os
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="crm-tests-")
+os.environ["CRM_DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ["CRM_DB_ASYNC"] = "0"
@@ -0,0 +1,136 @@
+"""
+Nº de queries por request: los listados y detalles con colecciones no deben
+lanzar una query por fila (N+1). Cada endpoint se mide con pocas y con
+muchas filas y tiene que hacer las mismas queries.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import models
+from app.database import Base, SessionLocal, engine
+from app.main import app
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    """
+    Dos compañías: `small` con un contacto, un deal y una actividad, y
+    `big` con 8 contactos y 8 deals con 3 actividades cada uno.
+    """
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        user = models.User(name="Ana", email="ana@example.com", hashed_password="x")
+        db.add(user)
+        db.flush()
+        due = datetime(2026, 10, 1, 9, 0)
+        ids = {}
+        for name, size in (("small", 1), ("big", 8)):
+            company = models.Company(name=f"Company {name}", owner_user_id=user.id)
+            db.add(company)
+            db.flush()
+            contacts, deals = [], []
+            for i in range(size):
+                contact = models.Contact(
+                    first_name=f"{name}{i}",
+                    last_name="Pérez",
+                    email=f"{name}{i}@example.com",
+                    company_id=company.id,
+                    owner_user_id=user.id,
+                )
+                db.add(contact)
+                db.flush()
+                deal = models.Deal(
+                    title=f"Deal {name} {i}",
+                    amount=1000,
+                    company_id=company.id,
+                    contact_id=contact.id,
+                    owner_user_id=user.id,
+                )
+                db.add(deal)
+                db.flush()
+                contacts.append(contact.id)
+                deals.append(deal.id)
+            # cada actividad de un deal con un contacto distinto (y cada
+            # actividad de un contacto con un deal distinto): una carga perezosa
+            # por fila no se quedaría en el identity map
+            for i in range(size):
+                for j in range(1 if size == 1 else 3):
+                    db.add(
+                        models.Activity(
+                            type="call",
+                            subject=f"Call {i}.{j}",
+                            due_date=due + timedelta(hours=i * 3 + j),
+                            deal_id=deals[i],
+                            contact_id=contacts[(i + j) % size],
+                            owner_user_id=user.id,
+                        )
+                    )
+            ids[name] = {"company": company.id, "contact": contacts[0], "deal": deals[0]}
+        db.commit()
+    finally:
+        db.close()
+    return ids
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def count_queries():
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+
+    def run(client, url):
+        counter.count = 0
+        response = client.get(url)
+        assert response.status_code == 200, response.text
+        return counter.count, response.json()
+
+    yield run
+    event.remove(engine, "before_cursor_execute", counter)
+
+
+def test_activities_list_query_count_independent_of_page_size(seeded, client, count_queries):
+    small, small_body = count_queries(client, "/activities/?limit=5")
+    large, large_body = count_queries(client, "/activities/?limit=50")
+    assert len(small_body) == 5
+    assert len(large_body) > 5
+    assert small == large == 1
+
+
+def test_company_detail_query_count_independent_of_size(seeded, client, count_queries):
+    small, _ = count_queries(client, f"/companies/{seeded['small']['company']}/detail")
+    big, body = count_queries(client, f"/companies/{seeded['big']['company']}/detail")
+    assert len(body["contacts"]) == 8
+    assert len(body["deals"]) == 8
+    assert small == big
+
+
+def test_contact_detail_query_count_independent_of_size(seeded, client, count_queries):
+    # el contacto de `big` tiene 3 actividades; el de `small`, una
+    small, _ = count_queries(client, f"/contacts/{seeded['small']['contact']}/detail")
+    big, body = count_queries(client, f"/contacts/{seeded['big']['contact']}/detail")
+    assert len(body["activities"]) == 3
+    assert small == big
+
+
+def test_deal_activities_query_count_independent_of_size(seeded, client, count_queries):
+    small, _ = count_queries(client, f"/deals/{seeded['small']['deal']}/activities")
+    big, body = count_queries(client, f"/deals/{seeded['big']['deal']}/activities")
+    assert len(body) == 3
+    assert small == big